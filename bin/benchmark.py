@@ -0,0 +1,237 @@
+#!/usr/bin/env python3
+import json
+import os
+import platform
+import random
+import statistics
+import subprocess
+import sys
+import tempfile
+import time
+from argparse import ArgumentParser
+from types import SimpleNamespace
+
+import numpy as np
+from deap import creator, tools
+
+import repair.approach.approachConfig as approachConfig
+from main import create_parser, run
+from repair.approach.optimization import expressiongenerator, selection
+from repair.approach.optimization.optimization import OptimizationApproach
+from repair.approach.requirement import Requirement
+from repair.approach.trace import get_trace_suite
+from repair.fitness.correctness.correctness import get_satisfaction_degrees
+from repair.fitness.desirability.desirability import Desirability
+from repair.fitness.desirability.satisfactionextent import VerticalAndHorizontalExtent
+from repair.fitness.desirability.semanticintegrity import VarTypeConsistencyCheck, Z3TautologyCheck, \
+    TautologyAndVarTypeSanity
+from repair.fitness.desirability.syntacticsimilarity import TreeEditDistance
+from repair.fitness.desirability.verdictcache import VerdictCache, get_verdict_cache
+from utils import REQUIREMENTS, INPUT_VARIABLES
+
+# How to run:
+
+# bin/benchmark.py                                # All benchmarks, results in output/benchmark.json
+# bin/benchmark.py micro -c output/baseline.json  # Micro-benchmarks only, compared with a previous result file
+# bin/benchmark.py macro scaling -i 5             # Full repairs only, with 5 iterations
+
+SUITES = ("micro", "macro", "scaling")
+SCRIPTS_DIR = os.path.join(os.path.dirname(os.path.abspath(__file__)), os.pardir, "scripts")
+
+
+def create_parser_benchmark():
+    parser = ArgumentParser(description="Benchmarks the repair pipeline, writing the timings as JSON")
+    parser.add_argument("suites", nargs="*", help=f"Benchmark suites to run in {{{', '.join(SUITES)}}}, "
+                                                  f"defaults to all")
+    parser.add_argument("-o", "--output", default="output/benchmark.json",
+                        help="Path of the JSON result file, defaults to 'output/benchmark.json'")
+    parser.add_argument("-c", "--compare", default=None,
+                        help="Path of a previous JSON result file (e.g. of another commit) to compare with")
+    parser.add_argument("-s", "--seed", type=int, default=0, help="Random seed, defaults to 0")
+    parser.add_argument("-r", "--repeats", type=int, default=5,
+                        help="Number of timed repetitions of each micro-benchmark, defaults to 5")
+    parser.add_argument("-m", "--candidates", type=int, default=50,
+                        help="Number of random candidate requirements used by the micro-benchmarks, defaults to 50")
+    parser.add_argument("-i", "--iterations", type=int, default=10,
+                        help="Number of iterations of the full repairs, defaults to 10")
+    parser.add_argument("-mr", "--macro-repeats", type=int, default=1,
+                        help="Number of timed repetitions of each full repair, defaults to 1")
+    parser.add_argument("-st", "--scaling-traces", default="5,20,80",
+                        help="Trace counts of the synthetic suites, defaults to 5,20,80")
+    parser.add_argument("-sl", "--scaling-length", default="200,800,3200",
+                        help="Trace lengths of the synthetic suites, defaults to 200,800,3200")
+    parser.add_argument("-sv", "--scaling-variables", default="0,4,16",
+                        help="Extra variable counts of the synthetic suites, defaults to 0,4,16")
+    return parser
+
+
+def measure(fn, repeats):
+    """
+    Times repeats calls of fn, after a warm-up call. Returns the timings (seconds) and the last result of fn.
+    """
+    result = fn()
+    times = []
+    for _ in range(repeats):
+        start_time = time.perf_counter()
+        result = fn()
+        times.append(time.perf_counter() - start_time)
+    return {"min": min(times), "median": statistics.median(times), "mean": statistics.mean(times),
+            "repeats": repeats}, result
+
+
+def create_approach(trace_suite, requirement):
+    # Same setup as bin/main.py with its default arguments
+    des = Desirability(trace_suite=trace_suite, semantic=TautologyAndVarTypeSanity(Z3TautologyCheck()),
+                       syntactic=TreeEditDistance(), satisfaction=VerticalAndHorizontalExtent(),
+                       weights=[1.0, 1.0, 1.0])
+    return OptimizationApproach(trace_suite, REQUIREMENTS["traces"][requirement], 10, 1.2, des,
+                                approachConfig.CONFIG_MAP["default"], "no_aggregation")
+
+
+def run_micro(args, results):
+    random.seed(args.seed)
+    suite = get_trace_suite("data/traces", INPUT_VARIABLES["traces"], 0.0)
+    approach = create_approach(suite, "REQ")
+    candidates = approach.toolbox.population(n=args.candidates)
+    init_requirement = approach.init_requirement
+
+    def requirements():
+        # Fresh requirements, whose properties (e.g. the merged tree) are not cached yet
+        return [Requirement("Candidate", approach.toolbox, approach.pset_pre, ind.pre, approach.pset_post, ind.post)
+                for ind in candidates]
+
+    def satisfaction_degrees():
+        return [get_satisfaction_degrees(ind.pre, ind.post, suite) for ind in candidates]
+
+    def tautology_check():
+        check = Z3TautologyCheck(verdict_cache=VerdictCache())  # no verdicts cached from previous repetitions
+        return [check.evaluate_sat(suite, req) for req in requirements()]
+
+    def tree_edit_distance():
+        ted = TreeEditDistance()
+        return [ted.evaluate(req, init_requirement) for req in requirements()]
+
+    def var_type_consistency():
+        check = VarTypeConsistencyCheck()
+        return [check.evaluate(suite, req) for req in requirements()]
+
+    def generate_expr():
+        return [expressiongenerator.generate_expr(approach.pset_post, approach.config.post_tree_min_depth,
+                                                  approach.config.post_tree_max_depth) for _ in candidates]
+
+    benchmarks = {
+        "get_satisfaction_degrees": satisfaction_degrees,
+        "Z3TautologyCheck.evaluate_sat": tautology_check,
+        "TreeEditDistance.evaluate": tree_edit_distance,
+        "VarTypeConsistencyCheck.evaluate": var_type_consistency,
+        "generate_expr": generate_expr,
+    }
+    for name, fn in benchmarks.items():
+        timings, _ = measure(fn, args.repeats)
+        results[f"micro/{name}"] = dict(timings, calls=len(candidates))
+        print(f"micro/{name}: {timings['median']:.4f}s")
+
+    # Selection of the next generation (mu + lambda) on random fitness values, against DEAP's implementation
+    rng = np.random.RandomState(args.seed)
+    objectives = len(creator.FitnessMin.weights)
+    for size in (100, 1000):
+        # Only the fitness of the individuals is used by the selection
+        pop = [SimpleNamespace(fitness=creator.FitnessMin(tuple(values)))
+               for values in rng.randint(0, 20, size=(size, objectives)).astype(float)]
+        for name, select in (("sel_nsga2", selection.sel_nsga2), ("selNSGA2", tools.selNSGA2)):
+            timings, _ = measure(lambda: select(pop, size // 2), args.repeats)
+            results[f"micro/{name}/{size}"] = dict(timings, calls=1)
+            print(f"micro/{name}/{size}: {timings['median']:.4f}s")
+
+
+def run_repair(args, trace_suite, requirement, output_dir):
+    """
+    Runs a full repair with bin/main.py, from the same random seed and an empty Z3 verdict cache at each repetition.
+    """
+    args_main = create_parser().parse_args([trace_suite, requirement, "-i", str(args.iterations), "-o", output_dir])
+    get_trace_suite(trace_suite, INPUT_VARIABLES[trace_suite.split("/")[-1]], args_main.prev0)  # not timed
+
+    def repair():
+        random.seed(args.seed)
+        get_verdict_cache.cache_clear()
+        return run(args_main)
+
+    timings, stats = measure(repair, args.macro_repeats)
+    return dict(timings, repairs=len(stats),
+                best_correctness=min((s["f_correctness"] for s in stats), default=None))
+
+
+def run_macro(args, results, output_dir):
+    for trace_suite, requirement in (("data/traces", "REQ"), ("data/dummy", "REQ"), ("data/dummy", "SCALING")):
+        name = f"macro/{trace_suite.split('/')[-1]}/{requirement}"
+        results[name] = run_repair(args, trace_suite, requirement, output_dir)
+        print(f"{name}: {results[name]['median']:.4f}s")
+
+
+def run_scaling(args, results, output_dir):
+    # Synthetic dummy suites growing in one dimension at a time, from the smallest values of the others
+    dimensions = {"traces": [int(v) for v in args.scaling_traces.split(",")],
+                  "length": [int(v) for v in args.scaling_length.split(",")],
+                  "variables": [int(v) for v in args.scaling_variables.split(",")]}
+    base_size = {dimension: values[0] for dimension, values in dimensions.items()}
+    sizes = []
+    for dimension, values in dimensions.items():
+        sizes.extend(dict(base_size, **{dimension: value}) for value in values)
+    sizes = [dict(s) for s in dict.fromkeys(tuple(size.items()) for size in sizes)]  # unique, in order
+
+    with tempfile.TemporaryDirectory() as data_dir:
+        for size in sizes:
+            tag = f"t{size['traces']}_l{size['length']}_v{size['variables']}"
+            trace_suite = f"{data_dir}/{tag}/dummy"  # named after the case study, for its requirements
+            subprocess.run([sys.executable, os.path.join(SCRIPTS_DIR, "generate_dummy_data.py"), "-o", trace_suite,
+                            "-t", str(size["traces"]), "-l", str(size["length"]), "-n", str(size["variables"]),
+                            "-s", str(args.seed)], check=True)
+            name = f"scaling/{tag}"
+            results[name] = dict(run_repair(args, trace_suite, "SCALING", output_dir), **size)
+            print(f"{name}: {results[name]['median']:.4f}s")
+
+
+def git_commit():
+    try:
+        return subprocess.run(["git", "rev-parse", "HEAD"], capture_output=True, text=True,
+                              check=True).stdout.strip()
+    except (OSError, subprocess.CalledProcessError):
+        return None
+
+
+def compare(results, baseline_path):
+    with open(baseline_path, encoding="utf-8") as baseline_file:
+        baseline = json.load(baseline_file)
+    print(f"Comparison with {baseline_path} (commit {baseline.get('commit')}), median time ratio (new/old):")
+    for name, result in results.items():
+        old = baseline["benchmarks"].get(name)
+        if old is not None and old["median"] > 0:
+            print(f"  {name:<48} {old['median']:>10.4f}s -> {result['median']:>10.4f}s  "
+                  f"x{result['median'] / old['median']:.2f}")
+
+
+if __name__ == "__main__":
+    args = create_parser_benchmark().parse_args()
+    suites = args.suites or list(SUITES)
+    unknown = set(suites) - set(SUITES)
+    if unknown:
+        raise ValueError(f"Invalid benchmark suites: {', '.join(sorted(unknown))}")
+
+    results = {}
+    with tempfile.TemporaryDirectory() as output_dir:  # repair outputs are not kept
+        if "micro" in suites:
+            run_micro(args, results)
+        if "macro" in suites:
+            run_macro(args, results, output_dir)
+        if "scaling" in suites:
+            run_scaling(args, results, output_dir)
+
+    report = {"commit": git_commit(), "date": time.strftime("%Y-%m-%dT%H:%M:%S"), "python": platform.python_version(),
+              "platform": platform.platform(), "processors": os.cpu_count(), "arguments": vars(args),
+              "benchmarks": results}
+    os.makedirs(os.path.dirname(args.output) or ".", exist_ok=True)
+    with open(args.output, "w", encoding="utf-8") as output_file:
+        json.dump(report, output_file, indent=2)
+    print(f"Results saved in {args.output}")
+    if args.compare is not None:
+        compare(results, args.compare)
@@ -1,11 +1,27 @@
 #!/usr/bin/env python3
 
-from concurrent.futures import ProcessPoolExecutor, as_completed
+import os
+import time
 from argparse import ArgumentParser
 
 import pandas as pd
 
-from main import create_parser, run
+from main import create_parser, get_run_id, run
+from repair.approach.trace import get_trace_suite
+from scheduler import Job, Scheduler
+from utils import INPUT_VARIABLES
+
+def init_worker(suites):
+    # Import the solver and GP modules once per worker, and attach to the memory-mapped trace suites
+    import deap.gp
+    import z3
+    for path, in_variable_names, prev0 in suites:
+        get_trace_suite(path, in_variable_names, prev0)
+
+def run_timed(args_main):
+    start_time = time.time()
+    stats = run(args_main)
+    return stats, time.time() - start_time
 
 def create_parser_eval():
     parser = ArgumentParser(description="Runs experimental evaluation of ReqRep")
@@ -13,6 +29,15 @@ def create_parser_eval():
     parser.add_argument("-p", "--processes", default=None,
                         help="Number of processes for parallel computation, "
                              "defaults to the number of processors on the running computer")
+    parser.add_argument("-zc", "--z3-cache", default="output/z3_verdicts.sqlite",
+                        help="Path of the SQLite file sharing Z3 tautology verdicts across runs, "
+                             "defaults to output/z3_verdicts.sqlite")
+    parser.add_argument("-r", "--retries", type=int, default=2,
+                        help="Number of times a failed run is retried, with exponential backoff, defaults to 2")
+    parser.add_argument("-b", "--backoff", type=float, default=30.0,
+                        help="Seconds before the first retry of a failed run (doubled at each retry), defaults to 30")
+    parser.add_argument("-f", "--force", action="store_true",
+                        help="Also re-run the runs that the manifest (output/manifest.jsonl) records as completed")
     parser.add_argument("-st", "--smoke-test", action="store_true",
                         help="Run a smoke test with minimal configurations")
 
@@ -72,33 +97,39 @@ if __name__ == "__main__":
     
     # Run all configs
     parser_main = create_parser()
-    futures = {}
     output_dir = "output"
     csv_filename = "results.csv"
     csv_path = f"{output_dir}/{csv_filename}"
-    csv_header = True
-    with ProcessPoolExecutor(max_workers=processes) as executor:
-        for case_study, requirements in case_studies.items():
-            for requirement in requirements:
-                for aggregation, weights, tautology_check, approach_config in run_configurations:
-                    for i in range(samples):
-                        cmd = [f"{case_study_dir}/{case_study}",
-                               requirement,
-                               "-o", output_dir,
-                               "-a", aggregation,
-                               "-w", ",".join(str(w) for w in weights),
-                               "-tc", tautology_check,
-                               "-ac", approach_config,
-                               "-s", f"{i}"]
-                        args_main = parser_main.parse_args(cmd)
-                        futures[executor.submit(run, args_main)] = args_main
-        for future in as_completed(futures.keys()):
-            print(f"Completed: {vars(futures[future])}")
-            try:
-                res = future.result()
-                pd.DataFrame(res).to_csv(csv_path, mode="a", index=False, header=csv_header)
-                if csv_header:
-                    csv_header = False
-            except Exception as e:
-                print(f"Error: {e}")
+    jobs = []
+    for case_study, requirements in case_studies.items():
+        for requirement in requirements:
+            for aggregation, weights, tautology_check, approach_config in run_configurations:
+                for i in range(samples):
+                    cmd = [f"{case_study_dir}/{case_study}",
+                           requirement,
+                           "-o", output_dir,
+                           "-a", aggregation,
+                           "-w", ",".join(str(w) for w in weights),
+                           "-tc", tautology_check,
+                           "-zc", args_eval.z3_cache,
+                           "-ac", approach_config,
+                           "-s", f"{i}"]
+                    args_main = parser_main.parse_args(cmd)
+                    run_id = get_run_id(args_main)
+                    jobs.append(Job(f"{run_id}/{args_main.suffix}", (run_id, f"{case_study}_{requirement}"), args_main))
+
+    def save_results(job, res):
+        # Results are appended as runs complete, the header is written once (restarts append to the same file)
+        csv_header = not os.path.exists(csv_path) or os.path.getsize(csv_path) == 0
+        pd.DataFrame(res).to_csv(csv_path, mode="a", index=False, header=csv_header)
+
+    # Load each case study once (and write its binary cache once, instead of a race between workers)
+    suites = []
+    for case_study in case_studies:
+        prev0 = parser_main.get_default("prev0")
+        get_trace_suite(f"{case_study_dir}/{case_study}", INPUT_VARIABLES[case_study], prev0)
+        suites.append((f"{case_study_dir}/{case_study}", INPUT_VARIABLES[case_study], prev0))
 
+    scheduler = Scheduler(f"{output_dir}/manifest.jsonl", processes, args_eval.retries, args_eval.backoff,
+                          initializer=init_worker, initargs=(suites,))
+    scheduler.run(jobs, run_timed, save_results, force=args_eval.force)
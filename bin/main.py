@@ -1,5 +1,8 @@
 #!/usr/bin/env python3
+import cProfile
+import dataclasses
 import os
+import pstats
 from argparse import ArgumentParser
 
 import repair.approach.approachConfig as approachConfig
@@ -9,15 +12,19 @@ from repair.fitness.desirability.desirability import Desirability
 from repair.fitness.desirability.semanticintegrity import \
     TautologyAndVarTypeSanity, Z3TautologyCheckWithSamplingFallback, SamplingBasedTautologyCheck
 from repair.fitness.desirability.syntacticsimilarity import TreeEditDistance
+from repair.fitness.desirability.verdictcache import get_verdict_cache
 import repair.utils as utils
 from repair.approach.optimization.optimization import OptimizationApproach
-from repair.approach.trace import TraceSuite
+from repair.approach.trace import get_trace_suite
 import repair.grammar.utils as grammar_utils
 import time
 
 TAUTOLOGY_CHECK_MAP = {
-    "smt": Z3TautologyCheckWithSamplingFallback(n_samples=10),
-    "sampling": SamplingBasedTautologyCheck(n_samples=10)
+    "smt": lambda verdict_cache, timeout, workers: Z3TautologyCheckWithSamplingFallback(n_samples=10,
+                                                                                        verdict_cache=verdict_cache,
+                                                                                        timeout=timeout,
+                                                                                        workers=workers),
+    "sampling": lambda verdict_cache, timeout, workers: SamplingBasedTautologyCheck(n_samples=10)
 }
 
 # How to run:
@@ -54,13 +61,103 @@ def create_parser():
                         help="The desirability weights, defaults to 1.0,1.0,1.0")
     parser.add_argument("-tc", "--tautology-check", default="smt", help="Method used for tautology checking in "
                                                                         "{smt, sampling}, defaults to smt")
+    parser.add_argument("-zt", "--z3-timeout", type=int, default=None,
+                        help="Timeout of each Z3 tautology check in milliseconds (on timeout, sampling is used), "
+                             "defaults to none")
+    parser.add_argument("-zw", "--z3-workers", type=int, default=0,
+                        help="Number of worker processes running Z3 tautology checks asynchronously, with the timeout "
+                             "enforced by killing the worker (requires -zt), defaults to 0 (checks run in-process)")
+    parser.add_argument("-zc", "--z3-cache", default=None,
+                        help="Path of a SQLite file persisting Z3 tautology verdicts across runs, defaults to none "
+                             "(verdicts are only cached in memory)")
+    parser.add_argument("-zp", "--z3-cache-precision", type=int, default=None,
+                        help="Number of decimal digits constants are rounded to when caching Z3 verdicts, "
+                             "defaults to none (exact constants)")
     parser.add_argument("-ac", "--approach-config", default="default", help="Category of hyperparameters to use")
+    parser.add_argument("-eb", "--evaluation-backend", default="serial",
+                        help="How offspring are evaluated in {serial, thread, process}, defaults to serial")
+    parser.add_argument("-ew", "--evaluation-workers", type=int, default=None,
+                        help="Number of threads/processes used by the evaluation backend, "
+                             "defaults to the number of processors")
+    parser.add_argument("-cb", "--correctness-bound", action="store_true",
+                        help="Stops checking the traces of an offspring once its correctness proves that it cannot "
+                             "survive the selection, checking first the traces that falsified the most candidates")
+    parser.add_argument("-sp", "--simplify", action="store_true",
+                        help="Simplifies the redundant forms of the offspring (e.g. not(not(x)), x and x, x - x) before "
+                             "evaluating them")
+    parser.add_argument("-ed", "--exact-distance", action="store_true",
+                        help="Uses the exact tree edit distance as syntactic similarity, instead of the number of "
+                             "operations of the zss edit script (which can be smaller)")
+    parser.add_argument("-tm", "--threshold-mutation", type=float, default=0.0,
+                        help="Probability of setting the constant of a comparison in the postcondition of an offspring "
+                             "from the sorted trace values (where the precondition holds), defaults to 0 (disabled)")
+    parser.add_argument("-tf", "--threshold-fraction", type=float, default=1.0,
+                        help="Fraction of the trace items (where the precondition holds) on which the comparisons set "
+                             "by the threshold mutation hold, defaults to 1.0")
+    parser.add_argument("-tb", "--time-budget", type=float, default=None,
+                        help="Wall-clock budget of the repair in seconds (checked after each generation), "
+                             "defaults to none")
+    parser.add_argument("-nb", "--evaluation-budget", type=int, default=None,
+                        help="Maximum number of distinct candidates evaluated, defaults to none")
+    parser.add_argument("-sg", "--stagnation-generations", type=int, default=0,
+                        help="Stops after this many generations without hypervolume improvement of the Pareto front, "
+                             "defaults to 0 (disabled)")
+    parser.add_argument("-is", "--islands", type=int, default=1,
+                        help="Number of sub-populations evolving in their own process, defaults to 1 (no island model)")
+    parser.add_argument("-mi", "--migration-interval", type=int, default=5,
+                        help="Generations between two migrations of the best individuals to the next island, "
+                             "defaults to 5")
+    parser.add_argument("-mg", "--migrants", type=int, default=2,
+                        help="Number of individuals migrating from each island, defaults to 2")
+    parser.add_argument("-ci", "--checkpoint-interval", type=int, default=0,
+                        help="Generations between two checkpoints of the repair in the output directory, "
+                             "defaults to 0 (no checkpoints)")
+    parser.add_argument("-r", "--resume", action="store_true",
+                        help="Resumes the repair from the latest checkpoint in the output directory, if any")
+    parser.add_argument("-pf", "--profile", nargs="?", const="cprofile", default=None,
+                        help="Profiles the repair with {cprofile, pyinstrument} (defaults to cprofile when the flag "
+                             "is given without a value), saving the profile in the output directory")
     parser.add_argument("-s", "--suffix", default="", help="An optional output file suffix")
     parser.add_argument("-v", "--verbose", action="store_true", help="Activates logging")
     parser.add_argument("-o", "--output_dir", default="output", help="Directory to save outputs, defaults to 'output'")
 
     return parser
 
+def get_run_id(args):
+    # Runs that differ only by their suffix (i.e. samples) share the run id, and their output directory
+    case_study = args.trace_suite.split("/")[-1]
+    weights = [float(w) for w in args.weights.split(",")]
+    return f"{case_study}_{args.requirement}_{args.aggregation.replace("_", "")}_{round(weights[0])}{round(weights[1])}{round(weights[2])}_{args.tautology_check}_{args.approach_config}"
+
+def profile_repair(approach, profiler, output_path):
+    """
+    Runs the repair of the approach under the profiler, saving the profile in output_path (plus an extension).
+    Only the main process is profiled (not the workers of the process backend or the islands).
+    """
+    os.makedirs(os.path.dirname(output_path) or ".", exist_ok=True)
+    if profiler == "cprofile":
+        profile = cProfile.Profile()
+        result = profile.runcall(approach.repair)
+        profile.dump_stats(f"{output_path}.prof")
+        with open(f"{output_path}.txt", "w", encoding="utf-8") as f:
+            pstats.Stats(profile, stream=f).sort_stats("cumulative").print_stats(50)
+        return result
+    if profiler == "pyinstrument":
+        try:
+            from pyinstrument import Profiler
+        except ImportError:
+            raise ValueError("The pyinstrument profiler is not installed (pip install pyinstrument)")
+        profile = Profiler()
+        profile.start()
+        try:
+            result = approach.repair()
+        finally:
+            profile.stop()
+        with open(f"{output_path}.html", "w", encoding="utf-8") as f:
+            f.write(profile.output_html())
+        return result
+    raise ValueError(f"Invalid profiler: {profiler}")
+
 def run(args):
     print(f"Running: {vars(args)}")
     logger = utils.setup_logger(args.verbose)
@@ -68,17 +165,22 @@ def run(args):
     # Define TRACE SUITE and REQUIREMENT
     case_study = args.trace_suite.split("/")[-1]
     req_text = REQUIREMENTS[case_study][args.requirement]
-    suite = TraceSuite(args.trace_suite, INPUT_VARIABLES[case_study], args.prev0)
+    suite = get_trace_suite(args.trace_suite, INPUT_VARIABLES[case_study], args.prev0)
 
     # Define DESIRABILITY
     weights = [float(w) for w in args.weights.split(",")]
-    tautology_check_method = TAUTOLOGY_CHECK_MAP.get(args.tautology_check)
-    if tautology_check_method is None:
+    tautology_check_factory = TAUTOLOGY_CHECK_MAP.get(args.tautology_check)
+    if tautology_check_factory is None:
         raise ValueError(f"Invalid tautology check method: {args.tautology_check}")
+    if args.z3_workers > 0 and args.z3_timeout is None:
+        raise ValueError("Z3 workers require a Z3 timeout (-zt), otherwise a worker that does not answer is waited "
+                         "forever")
+    tautology_check_method = tautology_check_factory(get_verdict_cache(args.z3_cache, args.z3_cache_precision),
+                                                     args.z3_timeout, args.z3_workers)
     des = Desirability(
         trace_suite=suite,
         semantic=TautologyAndVarTypeSanity(tautology_check_method),
-        syntactic=TreeEditDistance(),
+        syntactic=TreeEditDistance(args.exact_distance),
         satisfaction=VerticalAndHorizontalExtent(),
         weights=weights
     )
@@ -87,19 +189,34 @@ def run(args):
     config = approachConfig.CONFIG_MAP.get(args.approach_config)
     if config is None:
         raise ValueError(f"Invalid hyperparameter configuration: {args.approach_config}")
+    config = dataclasses.replace(config, evaluation_backend=args.evaluation_backend,
+                                 evaluation_workers=args.evaluation_workers,
+                                 correctness_bound=args.correctness_bound, simplify=args.simplify,
+                                 threshold_mutation_probability=args.threshold_mutation,
+                                 threshold_fraction=args.threshold_fraction, time_budget=args.time_budget,
+                                 evaluation_budget=args.evaluation_budget,
+                                 stagnation_generations=args.stagnation_generations, islands=args.islands,
+                                 migration_interval=args.migration_interval, migrants=args.migrants)
+
+    run_id = get_run_id(args)
+    output_dir = f"{args.output_dir}/{run_id}"
 
     # Define APPROACH and run REPAIR
     a = OptimizationApproach(suite, req_text, args.iterations, args.numbers, des, config, args.aggregation)
+    if args.checkpoint_interval > 0 or args.resume:
+        a.set_checkpoint(f"{output_dir}/checkpoint{args.suffix}.pkl", args.checkpoint_interval, args.resume)
+    a.set_metrics(f"{output_dir}/metrics{args.suffix}.jsonl")
     start_time = time.time()
-    all_repaired_reqs = a.repair()
+    if args.profile is None:
+        all_repaired_reqs = a.repair()
+    else:
+        all_repaired_reqs = profile_repair(a, args.profile, f"{output_dir}/profile{args.suffix}")
     elapsed = time.time() - start_time
     # Rank requirements by (1) correctness, (2) semantic desirability, (3) syntactic desirability, (4) satisfaction desirability
     all_repaired_reqs.sort(
         key=lambda r: (r.correctness, r.raw_desirability[0], r.raw_desirability[1], r.raw_desirability[2]))
 
     # Save results to file
-    run_id = f"{case_study}_{args.requirement}_{args.aggregation.replace("_", "")}_{round(weights[0])}{round(weights[1])}{round(weights[2])}_{args.tautology_check}_{args.approach_config}"
-    output_dir = f"{args.output_dir}/{run_id}"
     os.makedirs(output_dir, exist_ok=True)
     output_path = f"{output_dir}/repair{args.suffix}.txt"
     with open(output_path, "w", encoding="utf-8") as f:
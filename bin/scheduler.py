@@ -0,0 +1,159 @@
+import heapq
+import json
+import os
+import time
+from collections import deque, namedtuple
+from concurrent.futures import FIRST_COMPLETED, ProcessPoolExecutor, wait
+from concurrent.futures.process import BrokenProcessPool
+
+# job_id: unique id of the run (run_id and suffix); groups: ids of similar runs, from the most to the least specific,
+# used to estimate the time of runs that never completed; args: the arguments of the run
+Job = namedtuple("Job", ["job_id", "groups", "args"])
+
+
+class Scheduler:
+    """
+    Runs jobs in a process pool, keeping a manifest (JSON lines) of completed, failed and interrupted attempts.
+    Jobs completed in a previous invocation are skipped, failed jobs are retried with exponential backoff, and jobs
+    are submitted longest-expected-first (from the timings in the manifest), so that the pool does not drain on a
+    single straggler at the end.
+    """
+
+    def __init__(self, manifest_path, processes=None, retries=2, backoff=30.0, initializer=None, initargs=()):
+        self.manifest_path = manifest_path
+        self.processes = processes
+        self.initializer = initializer
+        self.initargs = initargs
+        self.retries = retries
+        self.backoff = backoff
+        self.records = self._read_manifest()
+
+    def _read_manifest(self):
+        records = []
+        try:
+            with open(self.manifest_path, encoding="utf-8") as manifest:
+                for line in manifest:
+                    try:
+                        records.append(json.loads(line))
+                    except json.JSONDecodeError:
+                        pass  # partial line of an interrupted write
+        except FileNotFoundError:
+            pass
+        return records
+
+    def _record(self, job, status, **fields):
+        record = {"job_id": job.job_id, "groups": list(job.groups), "status": status, **fields}
+        self.records.append(record)
+        os.makedirs(os.path.dirname(self.manifest_path) or ".", exist_ok=True)
+        with open(self.manifest_path, "a", encoding="utf-8") as manifest:
+            manifest.write(json.dumps(record) + "\n")
+
+    @property
+    def completed(self):
+        return set(record["job_id"] for record in self.records if record["status"] == "done")
+
+    def expected_times(self, jobs):
+        """
+        Estimates the time of each job: its own past time, or else the mean time of the most specific group of
+        similar jobs with known times, or else the mean time of all jobs (0 without timings).
+        """
+        times = {}
+        for record in self.records:
+            if record["status"] == "done":
+                for key in [record["job_id"]] + record["groups"]:
+                    times.setdefault(key, []).append(record["time"])
+        all_times = [record["time"] for record in self.records if record["status"] == "done"]
+        default = sum(all_times) / len(all_times) if all_times else 0.0
+        expected = {}
+        for job in jobs:
+            known = next((times[key] for key in (job.job_id,) + tuple(job.groups) if key in times), None)
+            expected[job.job_id] = sum(known) / len(known) if known else default
+        return expected
+
+    def _failed(self, job, attempt, e, delayed):
+        # Records the failed attempt, and schedules the next one after the backoff, unless it was the last
+        self._record(job, "failed", attempt=attempt, error=repr(e))
+        if attempt > self.retries:
+            print(f"Error: {job.job_id} failed {attempt} times, giving up ({e!r})")
+        else:
+            delay = self.backoff * 2 ** (attempt - 1)
+            print(f"Error: {job.job_id} failed ({e!r}), retrying in {delay:g}s")
+            heapq.heappush(delayed, (time.time() + delay, len(self.records), job, attempt + 1))
+
+    def _executor(self):
+        return ProcessPoolExecutor(max_workers=self.processes, initializer=self.initializer, initargs=self.initargs)
+
+    def run(self, jobs, fn, on_result, force=False):
+        """
+        Runs fn(job.args) for each job not completed yet (all jobs if force), calling on_result(job, result) in the
+        main process for each completed job; fn must return (result, elapsed seconds).
+        """
+        completed = set() if force else self.completed
+        todo = [job for job in jobs if job.job_id not in completed]
+        if len(todo) < len(jobs):
+            print(f"Skipping {len(jobs) - len(todo)} completed runs (see {self.manifest_path})")
+        expected = self.expected_times(todo)
+        todo.sort(key=lambda job: expected[job.job_id], reverse=True)  # stable: known order for ties
+
+        executor = self._executor()
+        futures = {}
+        delayed = []  # heap of (ready time, sequence number, job, attempt) retries
+        interruptions = {}  # job id -> number of times the pool broke while the job was in it with other jobs
+        isolated = deque()  # (job, attempt) of jobs interrupted too often, that run alone in the pool
+
+        def submit(job, attempt):
+            if interruptions.get(job.job_id, 0) > self.retries:
+                isolated.append((job, attempt))
+            else:
+                futures[executor.submit(fn, job.args)] = (job, attempt)
+
+        try:
+            for job in todo:
+                submit(job, 1)
+            while futures or delayed or isolated:
+                if not futures and isolated:
+                    job, attempt = isolated.popleft()
+                    futures[executor.submit(fn, job.args)] = (job, attempt)
+                if futures:
+                    timeout = max(0.0, delayed[0][0] - time.time()) if delayed else None
+                    done, _ = wait(futures, timeout=timeout, return_when=FIRST_COMPLETED)
+                else:
+                    time.sleep(max(0.0, delayed[0][0] - time.time()))
+                    done = set()
+                broken = []
+                for future in done:
+                    job, attempt = futures.pop(future)
+                    try:
+                        result, elapsed = future.result()
+                        on_result(job, result)
+                    except BrokenProcessPool as e:
+                        broken.append((job, attempt, e))
+                        continue
+                    except Exception as e:
+                        self._failed(job, attempt, e, delayed)
+                        continue
+                    self._record(job, "done", attempt=attempt, time=elapsed)
+                    print(f"Completed: {job.job_id} ({elapsed:.2f}s)")
+                if broken:
+                    # A worker died (e.g. out of memory): the pool cannot take new jobs anymore, and all the jobs in it
+                    # fail, whichever job killed the worker. A job alone in the pool is charged with the failure; the
+                    # others are submitted again right away with the same attempt, and run alone once they were
+                    # interrupted more than retries times (so that a job killing its worker cannot starve the others)
+                    executor.shutdown(wait=False, cancel_futures=True)
+                    executor = self._executor()
+                    interrupted = broken + [(job, attempt, None) for job, attempt in futures.values()]
+                    futures.clear()
+                    if len(interrupted) == 1:
+                        job, attempt, e = interrupted[0]
+                        self._failed(job, attempt, e, delayed)
+                        interrupted = []
+                    for job, attempt, e in interrupted:
+                        interruptions[job.job_id] = interruptions.get(job.job_id, 0) + 1
+                        self._record(job, "interrupted", attempt=attempt)
+                        print(f"Interrupted: {job.job_id} (worker pool broken), resubmitting it")
+                        submit(job, attempt)
+                while delayed and delayed[0][0] <= time.time():
+                    _, _, job, attempt = heapq.heappop(delayed)
+                    submit(job, attempt)
+        finally:
+            executor.shutdown(cancel_futures=True)
@@ -1,5 +1,6 @@
 REQUIREMENTS = {
-    "dummy": {"REQ": ("True", "lt(y, 1.0)")},
+    "dummy": {"REQ": ("True", "lt(y, 1.0)"),
+              "SCALING": ("and(ge(x, 5.0), le(x, 15.0))", "lt(y, 12.0)")},
     "traces": {"REQ": ("and(eq(reset, 1.0), and(le(BL, ic), le(ic, TL)))", "eq(yout, ic)")},
     "AFC": {
         "AFC29": (
@@ -1,21 +1,26 @@
 import csv
 import numpy as np
 import os
+from argparse import ArgumentParser
 
 
-def generate_csv_file(mconfigs, output_dir):
+def generate_csv_file(mconfigs, output_dir, length=200, variables=0, rng=np.random):
+    """
+    Writes one trace per config, with length items sampled every 0.1s: the input x, the output y drawn from the
+    config normal distribution and, for scaling experiments, extra outputs z0, z1, ... drawn from the same one.
+    """
     os.makedirs(output_dir, exist_ok=True)
-    time_values = np.arange(0, 20.0, 0.1)
+    time_values = np.arange(length) * 0.1
     for file_index, config in enumerate(mconfigs):
         mean = config['mean']
         std_dev = config['std_dev']
         filename = os.path.join(output_dir, f'dummy_{file_index:03d}.csv')
         with open(filename, 'w', newline='') as csvfile:
             writer = csv.writer(csvfile)
-            writer.writerow(['Time|s', 'x|s', 'y|m'])
+            writer.writerow(['Time|s', 'x|s', 'y|m'] + [f'z{i}|m' for i in range(variables)])
             for t in time_values:
-                y = np.random.normal(mean, std_dev)
-                writer.writerow([round(t, 1), round(t, 1), y])
+                y = rng.normal(mean, std_dev)
+                writer.writerow([round(t, 1), round(t, 1), y] + list(rng.normal(mean, std_dev, variables)))
 
 # Example usage:
 configs = [
@@ -26,4 +31,22 @@ configs = [
     {'mean': 9,  'std_dev': 2.5}
 ]
 
-generate_csv_file(mconfigs=configs, output_dir='data/dummy')
\ No newline at end of file
+
+def create_parser():
+    parser = ArgumentParser(description="Generates a dummy trace suite (the defaults reproduce data/dummy)")
+    parser.add_argument("-o", "--output_dir", default="data/dummy", help="Directory to save the traces, "
+                                                                         "defaults to 'data/dummy'")
+    parser.add_argument("-t", "--traces", type=int, default=len(configs),
+                        help=f"Number of traces (cycling through the example configs), defaults to {len(configs)}")
+    parser.add_argument("-l", "--length", type=int, default=200, help="Number of items per trace, defaults to 200")
+    parser.add_argument("-n", "--variables", type=int, default=0,
+                        help="Number of extra output variables besides x and y, defaults to 0")
+    parser.add_argument("-s", "--seed", type=int, default=None, help="Random seed, defaults to none")
+    return parser
+
+
+if __name__ == "__main__":
+    args = create_parser().parse_args()
+    rng = np.random if args.seed is None else np.random.RandomState(args.seed)
+    generate_csv_file(mconfigs=[configs[i % len(configs)] for i in range(args.traces)], output_dir=args.output_dir,
+                      length=args.length, variables=args.variables, rng=rng)
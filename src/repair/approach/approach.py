@@ -7,7 +7,8 @@ from repair.fitness.desirability.desirability import Desirability
 from repair.approach.trace import TraceSuite
 from deap import base, gp
 from repair.approach.optimization import expressiongenerator
-from repair.fitness.correctness import correctness
+from repair.fitness.correctness import compiler, correctness
+from repair.fitness.correctness.subtreecache import SubtreeCache
 
 
 # TODO complete below, once we have multiple approaches
@@ -20,19 +21,40 @@ class Approach(ABC):
                  numbers_factor: float, desirability: Desirability=None, config:ApproachConfig=None):
     
         self.trace_suite = trace_suite
+        self.requirement_text = requirement_text
         self.iterations = iterations
+        self.numbers_factor = numbers_factor
         self.desirability = desirability
         self.config = config
+        self._setup()
 
-        self.pset_pre, self.pset_post= grammar.get_gp_primitive_sets(self.trace_suite, numbers_factor)
+    def _setup(self):
+        self.subtree_cache = None
+        if self.config.subtree_cache_bytes > 0:
+            # Robustness vectors of the subtrees evaluated in this process (each worker process has its own)
+            self.subtree_cache = SubtreeCache(self.config.subtree_cache_bytes)
+        # Falsifying traces of the candidates evaluated in this process, checked first by bounded trace checking
+        self.killer_traces = correctness.KillerTraces(len(self.trace_suite.traces))
+        self.pset_pre, self.pset_post= grammar.get_gp_primitive_sets(self.trace_suite, self.numbers_factor)
         self.toolbox = self.init_toolbox()
-        self.init_requirement = Requirement("Initial", self.toolbox, self.pset_pre, requirement_text[0],
-                                            self.pset_post, requirement_text[1])
+        self.init_requirement = Requirement("Initial", self.toolbox, self.pset_pre, self.requirement_text[0],
+                                            self.pset_post, self.requirement_text[1])
 
         # Handle desirability
         if self.desirability is not None:
             self.desirability.initial_requirement = self.init_requirement
 
+    def __getstate__(self):
+        # Primitive sets and toolbox hold closures: rebuild them when unpickling (e.g. in worker processes)
+        state = self.__dict__.copy()
+        for name in ("pset_pre", "pset_post", "toolbox", "init_requirement", "subtree_cache", "killer_traces"):
+            state.pop(name, None)
+        return state
+
+    def __setstate__(self, state):
+        self.__dict__.update(state)
+        self._setup()
+
     def init_toolbox(self):
         toolbox = base.Toolbox()
 
@@ -51,6 +73,8 @@ class Approach(ABC):
         # (2) Compilation
         toolbox.register("compile_pre", gp.compile, pset=self.pset_pre)
         toolbox.register("compile_post", gp.compile, pset=self.pset_post)
+        toolbox.register("compile_robustness", compiler.compile_tree, trace_suite=self.trace_suite,
+                         cache=self.subtree_cache)
 
         # (3) Metrics
         toolbox.register("get_sat_deg", correctness.get_satisfaction_degrees, trace_suite=self.trace_suite)
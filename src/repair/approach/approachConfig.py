@@ -9,6 +9,8 @@ class ApproachConfig:
     random_offsprings: bool = False # for the next population, chose random entries from the current population? or just iterate
     crossover_probability: float = 0.5 # currently set to 0.5 for both pre and post conditions
     mutation_probability: float = 0.3 # currently set to 0.3 for both pre and post conditions
+    threshold_mutation_probability: float = 0.0 # sets a postcondition constant from the sorted trace values (0 disables)
+    threshold_fraction: float = 1.0 # fraction of the items (where the precondition holds) the mutated comparison holds on
 
     # Tree size parameters
     pre_tree_min_depth: int = 2
@@ -16,6 +18,24 @@ class ApproachConfig:
     post_tree_min_depth: int = 2
     post_tree_max_depth: int = 3
 
+    # Evaluation parameters
+    fitness_archive_size: int = 10000 # max number of evaluated genomes remembered across generations (0 disables)
+    evaluation_backend: str = "serial" # how offspring are evaluated, in {serial, thread, process}
+    evaluation_workers: int = None # number of threads/processes, defaults to the number of processors
+    subtree_cache_bytes: int = 256 * 1024 * 1024 # memory bound of the per-process subtree robustness cache (0 disables)
+    correctness_bound: bool = False # stop checking the traces of offspring that cannot survive selection on correctness
+    simplify: bool = False # simplify the redundant forms of the offspring (e.g. not(not(x))) before evaluating them
+
+    # Stopping criteria (besides the number of iterations)
+    time_budget: float = None # wall-clock seconds of the evolutionary loop, checked after each generation
+    evaluation_budget: int = None # number of distinct candidates evaluated
+    stagnation_generations: int = 0 # stop after this many generations without hypervolume improvement of the HoF (0 disables)
+
+    # Island model parameters
+    islands: int = 1 # number of sub-populations evolving in their own process (1 disables the island model)
+    migration_interval: int = 5 # generations between two migrations along the ring of islands (0 disables migration)
+    migrants: int = 2 # number of best individuals sent to the next island at each migration
+
 CONFIG_MAP = {
     "default": ApproachConfig(),
     "alt_1": ApproachConfig(pop_size=20, num_offsprings=10, random_offsprings=True),
@@ -0,0 +1,54 @@
+import logging
+import os
+import pickle
+
+logger = logging.getLogger("gp_logger")
+
+
+class Checkpoint:
+    """
+    Periodic checkpoints of the evolutionary loop, in a pickle file that is atomically replaced (the latest
+    checkpoint survives a crash during a write).
+    A checkpoint holds the generation number, the population genomes with their fitness values and cached properties,
+    the hall of fame, the state of the stopping criteria, the fitness archive and the Python random state.
+    """
+    VERSION = 1
+
+    def __init__(self, path, interval=1):
+        self.path = path
+        self.interval = interval
+
+    def for_island(self, index):
+        root, ext = os.path.splitext(self.path)
+        return Checkpoint(f"{root}_island{index}{ext}", self.interval)
+
+    def due(self, gen):
+        return self.interval > 0 and (gen + 1) % self.interval == 0
+
+    def save(self, state):
+        state = dict(state, version=self.VERSION)
+        tmp_path = f"{self.path}.{os.getpid()}.tmp"
+        try:
+            os.makedirs(os.path.dirname(self.path) or ".", exist_ok=True)
+            with open(tmp_path, "wb") as checkpoint_file:
+                pickle.dump(state, checkpoint_file, protocol=pickle.HIGHEST_PROTOCOL)
+            os.replace(tmp_path, self.path)
+        except OSError as e:
+            logger.info(f"Could not write the checkpoint ({e})")
+
+    def load(self):
+        """
+        Returns the state of the latest checkpoint, or None.
+        """
+        try:
+            with open(self.path, "rb") as checkpoint_file:
+                state = pickle.load(checkpoint_file)
+        except FileNotFoundError:
+            return None
+        except (OSError, pickle.UnpicklingError, EOFError, AttributeError) as e:
+            logger.info(f"Checkpoint not usable ({e}), starting from scratch")
+            return None
+        if state.get("version") != self.VERSION:
+            logger.info(f"Checkpoint version {state.get('version')} not supported, starting from scratch")
+            return None
+        return state
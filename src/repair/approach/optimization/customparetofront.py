@@ -1,9 +1,40 @@
 from deap.tools import ParetoFront
 from bisect import bisect_right
+import numpy as np
+from repair.approach.optimization.selection import dominance_matrix
 
 class LightweightParetoFront(ParetoFront):
     def __init__(self):
         super().__init__()
+        # Weighted fitness of the items (rows, in the same order), the dominance index of the front
+        self.wvalues = None
+
+    def update(self, population):
+        """
+        Same result as DEAP's ParetoFront.update, but the dominance checks are vectorized and pruned.
+        Individuals dominated by the current front can never enter it, so they are discarded at once. The items are
+        sorted lexicographically by decreasing weighted fitness (hence by the first objective), so that only the items
+        before a new individual can dominate it and only the items after it can be dominated by it.
+        """
+        population = list(population)
+        if self.wvalues is not None and population:
+            wvalues = np.array([ind.fitness.wvalues for ind in population], dtype=float)
+            dominated = dominance_matrix(self.wvalues, wvalues).any(axis=0)
+            population = [ind for ind, is_dominated in zip(population, dominated) if not is_dominated]
+        for ind in population:
+            wvalues = np.asarray(ind.fitness.wvalues, dtype=float)
+            split = len(self) - bisect_right(self.keys, ind.fitness)
+            if split > 0:
+                better = self.wvalues[:split]
+                if np.any(np.all(better >= wvalues, axis=1) & np.any(better > wvalues, axis=1)):
+                    continue
+            if split < len(self):
+                worse = self.wvalues[split:]
+                removed = np.all(wvalues >= worse, axis=1) & np.any(wvalues > worse, axis=1)
+                for i in reversed(np.flatnonzero(removed) + split):
+                    self.remove(int(i))
+            # Requirements and their lightweight copies are never similar (no twins)
+            self.insert(ind)
 
     def insert(self, item):
         """
@@ -16,6 +47,19 @@ class LightweightParetoFront(ParetoFront):
         i = bisect_right(self.keys, item.fitness)
         self.items.insert(len(self) - i, item)
         self.keys.insert(i, item.fitness)
+        row = np.asarray(item.fitness.wvalues, dtype=float)
+        if self.wvalues is None:
+            self.wvalues = row[None, :]
+        else:
+            self.wvalues = np.insert(self.wvalues, len(self) - 1 - i, row, axis=0)
+
+    def remove(self, index):
+        super().remove(index)
+        self.wvalues = np.delete(self.wvalues, index, axis=0)
+
+    def clear(self):
+        super().clear()
+        self.wvalues = None
 
 class LightweightRequirement:
     def __init__(self, item):
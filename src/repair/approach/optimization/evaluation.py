@@ -0,0 +1,97 @@
+import functools
+import os
+from concurrent.futures import ProcessPoolExecutor, ThreadPoolExecutor
+
+from repair.metrics import metrics
+
+# The approach evaluating genomes in this process (the main process, or a pool worker holding its own copy)
+_approach = None
+
+
+def _init_worker(approach):
+    global _approach
+    _approach = approach
+
+
+def evaluate_genome(genome):
+    """
+    Evaluates a (pre, post) genome with the approach of the current process.
+    Returns the fitness tuple and the cached properties to restore on the individual.
+    """
+    return _approach.evaluate_genome(genome)
+
+
+def evaluate_bounded(item):
+    """
+    Evaluates a ((pre, post) genome, survival) item, with bounded trace checking (see the approach evaluate_genome).
+    """
+    genome, survival = item
+    return _approach.evaluate_genome(genome, survival)
+
+
+def _call_with_metrics(fn, item):
+    # In a worker process: the metrics of the call go back with its result, to be merged in the main process
+    return fn(item), metrics.take()
+
+
+class SerialBackend:
+    def __init__(self, approach, workers=None):
+        _init_worker(approach)
+
+    def map(self, fn, iterable):
+        return list(map(fn, iterable))
+
+    def close(self):
+        pass
+
+
+class ThreadBackend:
+    """
+    Threads share the trace suite and mostly wait on Z3 and NumPy, which release the GIL.
+    """
+    def __init__(self, approach, workers=None):
+        _init_worker(approach)
+        self.executor = ThreadPoolExecutor(max_workers=workers)
+
+    def map(self, fn, iterable):
+        return list(self.executor.map(fn, iterable))
+
+    def close(self):
+        self.executor.shutdown()
+
+
+class ProcessBackend:
+    """
+    Each worker process holds its own copy of the approach (with its preloaded trace suite): only genomes are sent
+    to the workers, and only fitness values and satisfaction degrees (and the metrics of the workers) are sent back.
+    """
+    def __init__(self, approach, workers=None):
+        _init_worker(approach)
+        self.workers = workers or os.cpu_count()
+        self.executor = ProcessPoolExecutor(max_workers=self.workers, initializer=_init_worker, initargs=(approach,))
+
+    def map(self, fn, iterable):
+        items = list(iterable)
+        chunksize = max(1, len(items) // (4 * self.workers))
+        results = []
+        for result, taken in self.executor.map(functools.partial(_call_with_metrics, fn), items, chunksize=chunksize):
+            metrics.merge(taken)
+            results.append(result)
+        return results
+
+    def close(self):
+        self.executor.shutdown()
+
+
+BACKEND_MAP = {
+    "serial": SerialBackend,
+    "thread": ThreadBackend,
+    "process": ProcessBackend,
+}
+
+
+def create_backend(name, approach, workers=None):
+    backend = BACKEND_MAP.get(name)
+    if backend is None:
+        raise ValueError(f"Invalid evaluation backend: {name}")
+    return backend(approach, workers)
@@ -0,0 +1,84 @@
+from collections import OrderedDict
+
+from deap import gp
+
+import repair.grammar.utils as grammar_utils
+
+
+class FitnessArchive:
+    """
+    Size-capped LRU archive of evaluated genomes, shared across generations.
+    Keyed by the (pre, post) genome strings, it stores the cached fitness properties of a Requirement, so that
+    an individual re-created or re-discovered by crossover/mutation is not evaluated from scratch.
+    canonical: whether the keys put the arguments of commutative functions in canonical order (see
+    grammar.utils.canonical), so that e.g. a and b and b and a are one genome. Only sound if the evaluated genomes are
+    in canonical order themselves (see simplification), since the syntactic similarity tells such genomes apart.
+    """
+    CACHED_PROPERTIES = ("satisfaction_degrees", "desirability", "raw_desirability")
+
+    def __init__(self, max_size=10000, canonical=False):
+        self.max_size = max_size
+        self.canonical = canonical
+        self.entries = OrderedDict()
+        self.hits = 0
+        self.misses = 0
+
+    def key(self, pre, post):
+        if self.canonical:
+            return (str(gp.PrimitiveTree(grammar_utils.canonical(pre))),
+                    str(gp.PrimitiveTree(grammar_utils.canonical(post))))
+        return str(pre), str(post)
+
+    def genome(self, ind):
+        return self.key(ind.pre, ind.post)
+
+    def restore(self, ind, properties=CACHED_PROPERTIES):
+        """
+        Copies the archived properties of the individual's genome into its cached properties.
+        Returns True on a hit.
+        """
+        genome = self.genome(ind)
+        entry = self.entries.get(genome)
+        if entry is None:
+            self.misses += 1
+            return False
+        self.entries.move_to_end(genome)
+        self.hits += 1
+        for name in properties:
+            if name in entry and name not in ind.__dict__:
+                ind.__dict__[name] = entry[name]
+        return True
+
+    @classmethod
+    def properties(cls, ind):
+        """
+        Returns the cached fitness properties of the individual.
+        """
+        return {name: ind.__dict__[name] for name in cls.CACHED_PROPERTIES if name in ind.__dict__}
+
+    def store(self, ind):
+        self._put(self.genome(ind), self.properties(ind))
+
+    def merge(self, entries):
+        """
+        Adds the (genome, properties) entries archived elsewhere, e.g. by another process.
+        """
+        for genome, properties in entries:
+            self._put(genome, properties)
+
+    def _put(self, genome, properties):
+        if self.max_size <= 0:
+            return
+        entry = self.entries.setdefault(genome, {})
+        entry.update(properties)
+        self.entries.move_to_end(genome)
+        while len(self.entries) > self.max_size:
+            self.entries.popitem(last=False)
+
+    @property
+    def hit_rate(self):
+        lookups = self.hits + self.misses
+        return self.hits / lookups if lookups else 0.0
+
+    def __len__(self):
+        return len(self.entries)
@@ -0,0 +1,137 @@
+import logging
+import multiprocessing
+import queue
+import random
+import traceback
+
+from deap import creator
+
+from repair.approach.optimization.customparetofront import LightweightParetoFront
+from repair.approach.optimization.fitnessarchive import FitnessArchive
+from repair.utils import setup_logger
+
+logger = logging.getLogger("gp_logger")
+
+
+class Migration:
+    """
+    Ring migration of an island: every interval generations, the best individuals of the island are sent to the next
+    island, and the ones received from the previous island replace the worst individuals of the population.
+    Migrants travel with their cached fitness properties, so they are not evaluated again.
+    """
+
+    def __init__(self, inbox, outbox, interval, migrants):
+        self.inbox = inbox
+        self.outbox = outbox
+        self.interval = interval
+        self.migrants = migrants
+        self.previous_done = False  # the previous island has stopped sending
+
+    def __call__(self, approach, gen, pop):
+        """
+        Migrates after generation gen; pop must be sorted by selection (best first). Returns the new population.
+        """
+        if self.interval <= 0 or self.migrants <= 0 or (gen + 1) % self.interval != 0:
+            return pop
+        self.outbox.put([(ind.pre, ind.post, FitnessArchive.properties(ind)) for ind in pop[:self.migrants]])
+        if self.previous_done:
+            return pop
+        message = self.inbox.get()
+        if message is None:
+            self.previous_done = True
+            return pop
+        genomes = set(approach.archive.genome(ind) for ind in pop)
+        immigrants = []
+        for pre, post, properties in message:
+            if approach.archive.key(pre, post) in genomes:
+                continue
+            ind = approach._individual(pre, post, properties)
+            approach.archive.store(ind)
+            immigrants.append(ind)
+        logger.info(f"  Migration: {len(immigrants)} immigrants")
+        return pop[:len(pop) - len(immigrants)] + immigrants
+
+    def close(self):
+        # Tell the next island, then consume what the previous island still sends: a process cannot exit while the
+        # data it put in a queue has not been read
+        self.outbox.put(None)
+        while not self.previous_done:
+            self.previous_done = self.inbox.get() is None
+
+
+def _run_island(approach, index, seed, inbox, outbox, results, verbose):
+    migration = Migration(inbox, outbox, approach.config.migration_interval, approach.config.migrants)
+    try:
+        setup_logger(verbose)
+        random.seed(seed)
+        if not hasattr(creator, "Individual"):
+            approach._init_creator()
+        approach.migration = migration
+        if approach.checkpoint is not None:
+            approach.checkpoint = approach.checkpoint.for_island(index)
+        if approach.metrics_writer is not None:
+            approach.metrics_writer = approach.metrics_writer.for_island(index)
+        logger.info(f"Island {index}: random seed {seed}")
+        hof = approach._repair_population()
+        entries = [(genome, approach.archive.entries[genome])
+                   for genome in set((ind.pre, ind.post) for ind in hof) if genome in approach.archive.entries]
+        results.put((index, list(hof), entries, None))
+    except Exception:
+        results.put((index, None, None, traceback.format_exc()))
+    finally:
+        migration.close()
+
+
+def run_islands(approach):
+    """
+    Evolves config.islands sub-populations of the approach, each in its own process (with its own copy of the
+    approach, over the same memory-mapped trace suite), migrating along a ring.
+    Returns the merged Pareto front of the islands, and archives the fitness properties of its genomes.
+    The islands are spawned (the approach is pickled), since forking a process running threads (e.g. of a Z3 worker
+    pool or of the thread backend) or holding Z3 contexts is not safe.
+    """
+    islands = approach.config.islands
+    mp_context = multiprocessing.get_context("spawn")
+    inboxes = [mp_context.Queue() for _ in range(islands)]
+    results = mp_context.Queue()
+    seeds = [random.getrandbits(32) for _ in range(islands)]
+    verbose = logger.isEnabledFor(logging.INFO)
+    processes = [mp_context.Process(target=_run_island, args=(approach, i, seeds[i], inboxes[i],
+                                                              inboxes[(i + 1) % islands], results, verbose))
+                 for i in range(islands)]
+    for process in processes:
+        process.start()
+
+    outcomes = {}
+    try:
+        while len(outcomes) < islands:
+            try:
+                index, hof, entries, error = results.get(timeout=1)
+            except queue.Empty:
+                crashed = [i for i, process in enumerate(processes) if i not in outcomes and process.exitcode]
+                if crashed:
+                    raise RuntimeError(f"Island {crashed[0]} exited with code {processes[crashed[0]].exitcode}")
+                continue
+            if error is not None:
+                raise RuntimeError(f"Island {index} failed:\n{error}")
+            outcomes[index] = (hof, entries)
+    finally:
+        for process in processes:
+            if process.exitcode is None and len(outcomes) < islands:
+                process.terminate()
+            process.join()
+
+    # Merge the fronts in island order (a genome found by several islands is kept once)
+    merged = LightweightParetoFront()
+    genomes = set()
+    for index in range(islands):
+        hof, entries = outcomes[index]
+        approach.archive.merge(entries)
+        unique = []
+        for ind in hof:
+            if (ind.pre, ind.post) not in genomes:
+                genomes.add((ind.pre, ind.post))
+                unique.append(ind)
+        merged.update(unique)
+    logger.info(f"Islands: merged Pareto size = {len(merged)}")
+    return merged
@@ -3,12 +3,19 @@ from repair.approach.approach import Approach
 import random
 import logging
 from deap import base, creator, gp, tools
+import numpy as np
 from repair.approach.optimization.customparetofront import LightweightParetoFront
+from repair.approach.optimization.fitnessarchive import FitnessArchive
 from repair.approach.requirement import Requirement
-from repair.approach.optimization import expressiongenerator
+from repair.approach.optimization import checkpoint, evaluation, expressiongenerator, island, selection, \
+    simplification, stopping, thresholds
+from repair.metrics import MetricsWriter, metrics
 
 logger = logging.getLogger("gp_logger")
 
+# Timers of the phases of a generation (the other timers are the fitness components)
+PHASES = ("population", "crossover", "mutation", "evaluation", "selection", "migration", "checkpoint")
+
 
 class OptimizationApproach(Approach):
 
@@ -17,6 +24,13 @@ class OptimizationApproach(Approach):
         super().__init__(trace_suite, requirement_text, iterations, numbers_factor, desirability, config)
 
         self.set_fitness_aggregation(fitness_aggregation)
+        # With simplification, all genomes are in canonical order: canonical keys are the genomes themselves
+        self.archive = FitnessArchive(self.config.fitness_archive_size, canonical=self.config.simplify)
+        self.migration = None  # set in the processes of the island model
+        self.evaluations = 0  # distinct genomes evaluated in the current run
+        self.checkpoint = None
+        self.resume = False
+        self.metrics_writer = None
         self._init_creator()
         self._add_to_toolbox()
 
@@ -29,6 +43,21 @@ class OptimizationApproach(Approach):
             raise ValueError(f"Invalid fitness aggregation method: {fitness_aggregation}")
         self.fitness_aggregation = fitness_aggregation
 
+    def set_checkpoint(self, path, interval=1, resume=False):
+        """
+        Checkpoints the evolutionary loop into path every interval generations (and when it ends).
+        resume: whether to continue from the checkpoint in path, if there is one.
+        """
+        self.checkpoint = checkpoint.Checkpoint(path, interval)
+        self.resume = resume
+
+    def set_metrics(self, path):
+        """
+        Writes the metrics of the evolutionary loop (timers, counters, cache hit rates and front statistics) into
+        path as JSON lines: one record for the initial population, one per generation and one at the end.
+        """
+        self.metrics_writer = MetricsWriter(path)
+
     def _init_creator(self):
         if self.fitness_aggregation == "weighted_sum":
             creator.create("FitnessMin", base.Fitness, weights=(-1.0, -1.0))
@@ -51,7 +80,7 @@ class OptimizationApproach(Approach):
         self.toolbox.register("individual", requirement_individual)
         self.toolbox.register("population", tools.initRepeat, list, self.toolbox.individual)
 
-        self.toolbox.register("select", tools.selNSGA2)
+        self.toolbox.register("select", selection.sel_nsga2)
         self.toolbox.register("mate", gp.cxOnePoint)
         # if min_=0, then this requires a False or true terminal. Not supported.
         self.toolbox.register("expr_mut", expressiongenerator.generate_expr, min_=1, max_=2, condition_str="full")
@@ -63,127 +92,400 @@ class OptimizationApproach(Approach):
         self.toolbox.decorate("mutate_pre", gp.staticLimit(key=len, max_value=10))
         self.toolbox.decorate("mutate_post", gp.staticLimit(key=len, max_value=10))
 
-    def _repair(self):
+        # Sorted values of the postcondition expressions, for the threshold mutation (rebuilt in each process)
+        self.threshold_index = thresholds.ThresholdIndex(self.trace_suite, self.toolbox.compile_robustness)
+        self.toolbox.register("mutate_threshold", thresholds.mut_threshold, index=self.threshold_index,
+                              fraction=self.config.threshold_fraction)
 
-        def _set_ind_fitness(ind):
-            if self.fitness_aggregation == "weighted_sum":
-                ind.fitness.values = (ind.correctness, ind.desirability["des"])
-            elif self.fitness_aggregation == "no_aggregation":
-                filtered_tuple = tuple(
-                    val for val, w in zip(ind.desirability["tuple"], self.desirability.weights) if w != 0
-                )
-                ind.fitness.values = (ind.correctness,) + filtered_tuple
-        
-        # PLACEHOLDER - for quick testing
-        # def _set_ind_fitness(ind):
-        #     num_objectives = 2 if self.fitness_aggregation == "weighted_sum" else 1 + self.desirability.num_active_dimensions
-        #     ind.fitness.values = tuple(random.uniform(0, 10) for _ in range(num_objectives))
+    def __getstate__(self):
+        state = super().__getstate__()
+        state.pop("threshold_index", None)
+        return state
 
+    def __setstate__(self, state):
+        super().__setstate__(state)
+        self._add_to_toolbox()
+
+    def _fitness_values(self, ind):
+        return self._values(ind.correctness, ind.desirability)
+
+    def _values(self, correctness, desirability):
+        if self.fitness_aggregation == "weighted_sum":
+            return correctness, desirability["des"]
+        elif self.fitness_aggregation == "no_aggregation":
+            filtered_tuple = tuple(
+                val for val, w in zip(desirability["tuple"], self.desirability.weights) if w != 0
+            )
+            return (correctness,) + filtered_tuple
+
+    # PLACEHOLDER - for quick testing
+    # def _fitness_values(self, ind):
+    #     num_objectives = 2 if self.fitness_aggregation == "weighted_sum" else 1 + self.desirability.num_active_dimensions
+    #     return tuple(random.uniform(0, 10) for _ in range(num_objectives))
+
+    def _individual(self, pre, post, properties, values=None):
+        """
+        Re-creates an evaluated individual from its genome strings and cached fitness properties.
+        """
+        ind = creator.Individual(name="Candidate", toolbox=self.toolbox, pset_pre=self.pset_pre,
+                                 pset_post=self.pset_post, precond=pre, postcond=post)
+        ind.__dict__.update(properties)
+        ind.fitness.values = values if values is not None else self._fitness_values(ind)
+        return ind
+
+    def _max_correctness(self, ind, survival):
+        """
+        Returns the correctness fitness beyond which the individual cannot survive the selection, or None.
+        survival: the fitness values (rows) of individuals competing with it in the selection, and the number of
+        survivors k. Beyond the returned correctness, the lower bounds of the fitness of the individual (hence its
+        fitness) are dominated by at least k competitors, which are all in earlier fronts.
+        The lower bounds only grow with the correctness: the correctness values of the competitors are tried in order.
+        """
+        values, k = survival
+        weights = np.array(creator.FitnessMin.weights)
+        correctness_values = np.unique(values[:, 0])
+        lower_bounds = [self._values(correctness, des) for correctness, des in
+                        zip(correctness_values, self.desirability.lower_bounds(ind, correctness_values,
+                                                                               self._max_syntactic(values)))]
+        dominators = selection.dominance_matrix(values * weights, np.array(lower_bounds) * weights).sum(axis=0)
+        doomed = np.flatnonzero(dominators >= k)
+        return float(correctness_values[doomed[0]]) if len(doomed) else None
+
+    def _max_syntactic(self, values):
+        """
+        Returns the worst syntactic similarity among the fitness values (rows), or None if it is not an objective of
+        its own. A candidate whose syntactic similarity is worse is dominated by the same rows with any value beyond
+        it, so a lower bound of it is enough to bound the fitness of the candidate (see _max_correctness).
+        """
+        weights = self.desirability.weights
+        if self.fitness_aggregation != "no_aggregation" or weights[1] == 0:
+            return None
+        column = 2 if weights[0] != 0 else 1  # after the correctness and the semantic integrity
+        return float(values[:, column].max()) / weights[1]
+
+    def evaluate_genome(self, genome, survival=None):
+        """
+        survival: if given (see _max_correctness), trace checking stops once the correctness proves that the
+        individual cannot survive the selection. Its fitness values are then lower bounds, and its satisfaction
+        degrees are flagged as "bounded".
+        """
+        pre, post = genome
+        ind = Requirement(name="Candidate", toolbox=self.toolbox, pset_pre=self.pset_pre,
+                          pset_post=self.pset_post, precond=pre, postcond=post)
+        self.desirability.prefetch(ind)
+        if survival is not None:
+            ind.__dict__["satisfaction_degrees"] = self.toolbox.get_sat_deg(
+                ind.compiled_pre, ind.compiled_post, max_correctness=self._max_correctness(ind, survival),
+                killer_traces=self.killer_traces)
+        return self._fitness_values(ind), {"satisfaction_degrees": ind.satisfaction_degrees,
+                                           "desirability": ind.desirability}
+
+    def _evaluate(self, individuals, survival=None):
+        """
+        Sets the fitness of the individuals: genomes in the archive are restored, the others are evaluated (once
+        per distinct genome) through toolbox.map, in order, so that results do not depend on the backend.
+        survival: if given, the trace checking is bounded (see evaluate_genome), and bounded results are not archived.
+        """
+        pending = {}
+        for ind in individuals:
+            if self.archive.restore(ind):
+                ind.fitness.values = self._fitness_values(ind)
+            else:
+                pending.setdefault(self.archive.genome(ind), []).append(ind)
+        if self.config.evaluation_backend != "process":
+            # Start the asynchronous checks of all genomes in this process, they overlap with the trace checking
+            for inds in pending.values():
+                self.desirability.prefetch(inds[0])
+        genomes = [(inds[0].pre, inds[0].post) for inds in pending.values()]
+        self.evaluations += len(genomes)
+        if survival is None:
+            results = self.toolbox.map(self.toolbox.evaluate, genomes)
+        else:
+            results = self.toolbox.map(evaluation.evaluate_bounded, [(genome, survival) for genome in genomes])
+        for inds, (values, properties) in zip(pending.values(), results):
+            for ind in inds:
+                ind.__dict__.update(properties)
+                ind.fitness.values = values
+            if not properties["satisfaction_degrees"].get("bounded"):
+                self.archive.store(inds[0])
+
+    @staticmethod
+    def _is_bounded(ind):
+        # Without evaluating the satisfaction degrees of copies, that only hold their fitness values
+        return ind.__dict__.get("satisfaction_degrees", {}).get("bounded", False)
+
+    def _evaluate_bounded(self, pop, offspring):
+        """
+        Evaluates the offspring with invalid fitness, stopping the trace checking of the ones that cannot survive the
+        selection of len(pop) individuals among pop + offspring. A bounded offspring is dominated by at least len(pop)
+        individuals of exact fitness, so it is in a front after them whatever its exact fitness, and so are the
+        individuals its lower bounds dominate: it keeps its lower bounds, and the selection is the same as without
+        bounds.
+        """
+        competitors = [ind for ind in pop + offspring if ind.fitness.valid]
+        survival = (np.array([ind.fitness.values for ind in competitors], dtype=float), len(pop))
+        self._evaluate([ind for ind in offspring if not ind.fitness.valid], survival)
+        # Check the bounded offspring against all the exact fitness values (in case of rounding errors)
+        bounded = [ind for ind in offspring if self._is_bounded(ind)]
+        if not bounded:
+            return
+        exact = np.array([ind.fitness.wvalues for ind in pop + offspring if not self._is_bounded(ind)], dtype=float)
+        lower_bounds = np.array([ind.fitness.wvalues for ind in bounded], dtype=float)
+        dominators = selection.dominance_matrix(exact, lower_bounds).sum(axis=0)
+        survivors = [ind for ind, count in zip(bounded, dominators) if count < len(pop)]
+        metrics.count("bounded_rejected", len(bounded) - len(survivors))
+        metrics.count("bounded_reevaluated", len(survivors))
+        for ind in survivors:
+            for name in FitnessArchive.CACHED_PROPERTIES:
+                ind.__dict__.pop(name, None)
+        evaluations = self.evaluations
+        self._evaluate(survivors)
+        self.evaluations = evaluations  # the genomes were counted by their bounded evaluation
+
+    def _simplify(self, individuals):
+        """
+        Simplifies the genomes of the individuals before their evaluation, in the canonical order of the archive keys,
+        so that equivalent redundant forms (e.g. not(not(x)) and x, a and b and b and a) are one genome for the
+        archive and the deduplication, and fewer nodes are evaluated.
+        """
+        for ind in individuals:
+            simplification.simplify(ind.pre, self.pset_pre, self.trace_suite)
+            simplification.simplify(ind.post, self.pset_post, self.trace_suite)
+
+    def _repair(self):
+        if self.config.islands > 1:
+            return island.run_islands(self)
+        return self._repair_population()
+
+    def _repair_population(self):
+        backend = evaluation.create_backend(self.config.evaluation_backend, self, self.config.evaluation_workers)
+        self.toolbox.register("map", backend.map)
+        self.toolbox.register("evaluate", evaluation.evaluate_genome)
+        try:
+            return self._evolve()
+        finally:
+            backend.close()
+
+    def _save_checkpoint(self, generation, finished, pop, hof, stopping_criteria):
+        self.checkpoint.save({
+            "generation": generation,
+            "finished": finished,
+            # trees are pickled as they are: parsing their strings back would turn ephemeral constants into terminals
+            "population": [(ind.pre, ind.post, ind.fitness.values, FitnessArchive.properties(ind)) for ind in pop],
+            "hof": hof,
+            "stopping": stopping_criteria.progress(),
+            "evaluations": self.evaluations,
+            "archive": list(self.archive.entries.items()),
+            "random_state": random.getstate(),
+        })
+
+    def _restore_checkpoint(self, state, stopping_criteria):
+        """
+        Restores the state of a checkpoint, returns the population, the hall of fame and the next generation.
+        """
+        random.setstate(state["random_state"])
+        self.archive.merge(state["archive"])
+        self.evaluations = state["evaluations"]
+        stopping_criteria.resume(state["stopping"])
+        pop = [self._individual(pre, post, properties, values)
+               for pre, post, values, properties in state["population"]]
+        logger.info(f"Resuming from generation {state['generation']} ({self.checkpoint.path})")
+        # A run that was stopped by a stopping criterion is not continued
+        return pop, state["hof"], self.iterations if state["finished"] else state["generation"]
+
+    def _write_metrics(self, event, generation, elapsed, hof, stopping_criteria, **fields):
+        taken = metrics.take()
+        timers = taken["timers"]
+        counters = taken["counters"]
+        z3_lookups = sum(n for name, n in counters.items() if name.startswith("z3_"))
+        caches = {
+            "fitness_archive": {"hits": self.archive.hits, "misses": self.archive.misses,
+                                "hit_rate": self.archive.hit_rate, "size": len(self.archive)},
+            # Tautology checks answered by the verdict cache, in this generation
+            "z3_verdicts": {"hits": counters.get("z3_cached", 0), "misses": z3_lookups - counters.get("z3_cached", 0),
+                            "hit_rate": counters.get("z3_cached", 0) / z3_lookups if z3_lookups else 0.0},
+        }
+        if self.subtree_cache is not None:
+            caches["subtree_cache"] = {"hits": self.subtree_cache.hits, "misses": self.subtree_cache.misses,
+                                       "hit_rate": self.subtree_cache.hit_rate, "bytes": self.subtree_cache.bytes,
+                                       "size": len(self.subtree_cache)}
+        front = None
+        if len(hof) > 0:
+            values = [ind.fitness.values for ind in hof]
+            front = {"size": len(hof), "correct": sum(1 for v in values if v[0] == 0),
+                     "min": [min(column) for column in zip(*values)],
+                     "mean": [sum(column) / len(column) for column in zip(*values)],
+                     "hypervolume": stopping_criteria.hypervolume(hof)}
+        self.metrics_writer.write(dict(
+            event=event, generation=generation, time=elapsed, evaluations=self.evaluations,
+            phases={name: timers.pop(name)["time"] for name in PHASES if name in timers},
+            components=timers, counters=counters, caches=caches, front=front, **fields))
+
+    def _evolve(self):
         toolbox = self.toolbox
-        pop = toolbox.population(n=self.config.pop_size-1) # Random initial population (-1 is for the addition of the original requirement, which is not generated randomly)
-        orig = creator.Individual(name="Candidate", toolbox=self.toolbox, pset_pre=self.pset_pre,
-                                  pset_post=self.pset_post, precond=toolbox.clone(self.init_requirement.pre),
-                                  postcond=toolbox.clone(self.init_requirement.post))
-        pop.append(orig) # Plus original requirement
-        hof = LightweightParetoFront() # Hall of Fame, for keeping track of the best individuals
-
-        # (Initial) Evaluation
-        for ind in pop:
-            _set_ind_fitness(ind)
-        pop = toolbox.select(pop, len(pop))
-
-        # Evolutionary loop: run for a fixed number of generations
-        for gen in range(self.iterations):
-            start_time = time.time()
-            logger.info(f"  Generation {gen}:")
+        stopping_criteria = stopping.StoppingCriteria(self.config)
+        state = self.checkpoint.load() if self.checkpoint is not None and self.resume else None
+        metrics.take()  # discard what was measured before the loop (e.g. the initial requirement)
+        if state is not None:
+            pop, hof, first_gen = self._restore_checkpoint(state, stopping_criteria)
+        else:
+            if self.metrics_writer is not None:
+                self.metrics_writer.reset()
+            start_time = time.perf_counter()
+            self.evaluations = 0
+            first_gen = 0
+            pop = toolbox.population(n=self.config.pop_size-1) # Random initial population (-1 is for the addition of the original requirement, which is not generated randomly)
+            orig = creator.Individual(name="Candidate", toolbox=self.toolbox, pset_pre=self.pset_pre,
+                                      pset_post=self.pset_post, precond=toolbox.clone(self.init_requirement.pre),
+                                      postcond=toolbox.clone(self.init_requirement.post))
+            pop.append(orig) # Plus original requirement
+            if self.config.simplify:
+                self._simplify(pop)
+            hof = LightweightParetoFront() # Hall of Fame, for keeping track of the best individuals
+
+            # (Initial) Evaluation
+            with metrics.timer("evaluation"):
+                self._evaluate(pop)
+            stopping_criteria.set_reference(pop)
+            with metrics.timer("selection"):
+                pop = toolbox.select(pop, len(pop))
+            if self.metrics_writer is not None:
+                self._write_metrics("initial", None, time.perf_counter() - start_time, hof, stopping_criteria,
+                                    population=len(pop))
+
+        finished = False
+        reason = None
+        gen = first_gen - 1
+        for gen in range(first_gen, self.iterations):
+            generation_start = time.perf_counter()
+            logger.info("  Generation %d:", gen)
 
             logger.info("  Creating POPULATION ...")
-            # offspring = toolbox.select(pop, len(pop)) # Selection
-            # offspring = list(map(toolbox.clone, offspring))  # Deep copy the individuals
-            offspring = []
-
-            for i in range(self.config.num_offsprings):
-                # SELECT the individual to be copied
-                if self.config.random_offsprings:
-                    # Randomly choose from the current population
-                    ind = random.choice(pop)
-                else:
-                    # iterate through the population
-                    ind = pop[i % len(pop)]
-                # COPY the individual (deep copy)
-                ind_copy = creator.Individual(name="Candidate", toolbox=self.toolbox, pset_pre=self.pset_pre,
-                                              pset_post=self.pset_post, precond=toolbox.clone(ind.pre),
-                                              postcond=toolbox.clone(ind.post))
-                ind_copy.fitness.values = ind.fitness.values
-                offspring.append(ind_copy)
-            logger.info(f"  ... population created ({time.time() - start_time:.2f}s)")
-            start_time = time.time()
+            with metrics.timer("population") as timer:
+                # offspring = toolbox.select(pop, len(pop)) # Selection
+                # offspring = list(map(toolbox.clone, offspring))  # Deep copy the individuals
+                offspring = []
+
+                for i in range(self.config.num_offsprings):
+                    # SELECT the individual to be copied
+                    if self.config.random_offsprings:
+                        # Randomly choose from the current population
+                        ind = random.choice(pop)
+                    else:
+                        # iterate through the population
+                        ind = pop[i % len(pop)]
+                    # COPY the individual (deep copy)
+                    ind_copy = creator.Individual(name="Candidate", toolbox=self.toolbox, pset_pre=self.pset_pre,
+                                                  pset_post=self.pset_post, precond=toolbox.clone(ind.pre),
+                                                  postcond=toolbox.clone(ind.post))
+                    ind_copy.fitness.values = ind.fitness.values
+                    offspring.append(ind_copy)
+            logger.info("  ... population created (%.2fs)", timer.elapsed)
 
             logger.info("  CROSSOVER application ...")
-            p_crossover = self.config.crossover_probability
-            for child1, child2 in zip(offspring[::2], offspring[1::2]):
-                mated = False
-                if random.random() < p_crossover:
-                    mated = True
-                    toolbox.mate(child1.pre, child2.pre)
-                if random.random() < p_crossover:
-                    mated = True
-                    toolbox.mate(child1.post, child2.post)
-                if mated:
-                    del child1.fitness.values
-                    del child2.fitness.values
-            logger.info(f"  ... crossover applied ({time.time() - start_time:.2f}s)")
-            start_time = time.time()
+            with metrics.timer("crossover") as timer:
+                p_crossover = self.config.crossover_probability
+                for child1, child2 in zip(offspring[::2], offspring[1::2]):
+                    mated = False
+                    if random.random() < p_crossover:
+                        mated = True
+                        toolbox.mate(child1.pre, child2.pre)
+                    if random.random() < p_crossover:
+                        mated = True
+                        toolbox.mate(child1.post, child2.post)
+                    if mated:
+                        del child1.fitness.values
+                        del child2.fitness.values
+            logger.info("  ... crossover applied (%.2fs)", timer.elapsed)
 
             logger.info("  MUTATION application ...")
-            p_mutation = self.config.mutation_probability
-            for mutant in offspring:
-                mutated = False
-                if random.random() < p_mutation:
-                    mutated = True
-                    toolbox.mutate_pre(mutant.pre)
-                if random.random() < p_mutation:
-                    mutated = True
-                    toolbox.mutate_post(mutant.post)
-                if mutated:
-                    del mutant.fitness.values
-            logger.info(f"  ... mutation applied ({time.time() - start_time:.2f}s)")
-            start_time = time.time()
-
-            logger.info(f"  RE-EVALUATION of individuals with invalid fitness ...")
-            for ind in offspring:
-                if not ind.fitness.valid:
-                    _set_ind_fitness(ind)
-            logger.info(f"  ... individuals re-evaluated ({time.time() - start_time:.2f}s)")
-            start_time = time.time()
+            with metrics.timer("mutation") as timer:
+                p_mutation = self.config.mutation_probability
+                p_threshold = self.config.threshold_mutation_probability
+                for mutant in offspring:
+                    mutated = False
+                    if random.random() < p_mutation:
+                        mutated = True
+                        toolbox.mutate_pre(mutant.pre)
+                    if random.random() < p_mutation:
+                        mutated = True
+                        toolbox.mutate_post(mutant.post)
+                    # (no random draw when disabled, so that the runs without it are unchanged)
+                    if p_threshold > 0 and random.random() < p_threshold and toolbox.mutate_threshold(mutant):
+                        mutated = True
+                    if mutated:
+                        del mutant.fitness.values
+            logger.info("  ... mutation applied (%.2fs)", timer.elapsed)
+
+            logger.info("  RE-EVALUATION of individuals with invalid fitness ...")
+            evaluations = self.evaluations
+            with metrics.timer("evaluation") as timer:
+                invalid = [ind for ind in offspring if not ind.fitness.valid]
+                if self.config.simplify:
+                    self._simplify(invalid)
+                if self.config.correctness_bound:
+                    self._evaluate_bounded(pop, offspring)
+                else:
+                    self._evaluate(invalid)
+            logger.info("  ... individuals re-evaluated (%.2fs)", timer.elapsed)
+            logger.info("  Fitness archive: %d hits, %d misses (%.1f%% hit rate, %d genomes)",
+                        self.archive.hits, self.archive.misses, 100 * self.archive.hit_rate, len(self.archive))
+            if self.subtree_cache is not None and self.subtree_cache.hits + self.subtree_cache.misses > 0:
+                logger.info("  Subtree cache: %d hits, %d misses (%.1f%% hit rate, %.1f MiB in %d vectors)",
+                            self.subtree_cache.hits, self.subtree_cache.misses, 100 * self.subtree_cache.hit_rate,
+                            self.subtree_cache.bytes / 2**20, len(self.subtree_cache))
 
             logger.info("  SELECTION + UPDATE of HoF ...")
-            pop = toolbox.select(pop + offspring, len(pop))
+            with metrics.timer("selection") as timer:
+                pop = toolbox.select(pop + offspring, len(pop))
+
+                # Deduplication
+                unique_pop = []
+                seen = set()
+                hof_genomes = set((str(ind.pre), str(ind.post)) for ind in hof)
 
-            # Deduplication
-            unique_pop = []
-            seen = set()
-            hof_genomes = set((str(ind.pre), str(ind.post)) for ind in hof)
+                for ind in pop:
+                    genome = self.archive.genome(ind)
+                    if genome not in seen and genome not in hof_genomes:
+                        seen.add(genome)
+                        unique_pop.append(ind)
 
-            for ind in pop:
-                genome = (str(ind.pre), str(ind.post))
-                if genome not in seen and genome not in hof_genomes:
-                    seen.add(genome)
-                    unique_pop.append(ind)
+                hof.update(unique_pop)
+                # hof.update(pop)
+                # for ind in hof:
+                #     print(f"  HoF ind: {ind.pre} => {ind.post}, fitness: {ind.fitness.values}")
 
-            hof.update(unique_pop)
-            # hof.update(pop)
-            # for ind in hof:
-            #     print(f"  HoF ind: {ind.pre} => {ind.post}, fitness: {ind.fitness.values}")
+            logger.info("  ... HoF updated (%.2fs)", timer.elapsed)
 
-            logger.info(f"  ... HoF updated ({time.time() - start_time:.2f}s)")
+            logger.info("Generation %d: Pareto size = %d", gen, len(hof))
 
-            logger.info(f"Generation {gen}: Pareto size = {len(hof)}")
+            if self.migration is not None:
+                with metrics.timer("migration"):
+                    pop = self.migration(self, gen, pop)
 
             # If an individual is perfectly correct and perfectly desirable
-            if any(all(f == 0 for f in ind.fitness.values) for ind in pop):
+            finished = any(all(f == 0 for f in ind.fitness.values) for ind in pop)
+            if finished:
+                reason = "perfect individual found"
+            else:
+                reason = stopping_criteria.stop(hof, self.evaluations)
+                if reason is not None:
+                    logger.info("Stopping after generation %d: %s", gen, reason)
+                    finished = True
+
+            if self.checkpoint is not None and (finished or gen == self.iterations - 1 or self.checkpoint.due(gen)):
+                with metrics.timer("checkpoint"):
+                    self._save_checkpoint(gen + 1, finished, pop, hof, stopping_criteria)
+            if self.metrics_writer is not None:
+                self._write_metrics("generation", gen, time.perf_counter() - generation_start, hof,
+                                    stopping_criteria, offspring=len(offspring), invalid=len(invalid),
+                                    evaluated=self.evaluations - evaluations)
+            if finished:
                 break
 
+        if self.metrics_writer is not None:
+            self._write_metrics("end", gen, time.time() - stopping_criteria.start_time, hof, stopping_criteria,
+                                reason=reason or "iterations completed")
         return hof
 
     def repair(self):
@@ -198,8 +500,11 @@ class OptimizationApproach(Approach):
 
         sorted_hof_requirements = []
         for i, ind in enumerate(sorted_hof_repaired):
-            sorted_hof_requirements.append(Requirement(name=f"Repaired_{i}", toolbox=self.toolbox,
-                                        pset_pre=self.pset_pre, pset_post=self.pset_post,
-                                        precond=ind.pre, postcond=ind.post))
+            req = Requirement(name=f"Repaired_{i}", toolbox=self.toolbox,
+                              pset_pre=self.pset_pre, pset_post=self.pset_post,
+                              precond=ind.pre, postcond=ind.post)
+            # desirability is recomputed on the re-parsed trees, trace checking can be reused
+            self.archive.restore(req, ("satisfaction_degrees",))
+            sorted_hof_requirements.append(req)
 
         return sorted_hof_requirements
@@ -0,0 +1,104 @@
+from itertools import chain
+from operator import attrgetter
+
+import numpy as np
+
+# Rows of the dominance matrix computed at once, to bound the memory of the pairwise comparisons
+DOMINANCE_BLOCK_SIZE = 1024
+
+
+def dominance_matrix(wvalues, other=None):
+    """
+    Returns the boolean matrix D, where D[i, j] is True if the weighted fitness wvalues[i] dominates other[j]
+    (by default, other is wvalues).
+    """
+    other = wvalues if other is None else other
+    n, nobj = wvalues.shape
+    dominates = np.empty((n, len(other)), dtype=bool)
+    for begin in range(0, n, DOMINANCE_BLOCK_SIZE):
+        block = wvalues[begin:begin + DOMINANCE_BLOCK_SIZE]
+        not_worse = np.ones((len(block), len(other)), dtype=bool)
+        better = np.zeros((len(block), len(other)), dtype=bool)
+        for i in range(nobj):
+            not_worse &= block[:, i, None] >= other[None, :, i]
+            better |= block[:, i, None] > other[None, :, i]
+        dominates[begin:begin + DOMINANCE_BLOCK_SIZE] = not_worse & better
+    return dominates
+
+
+def sort_nondominated(wvalues, k, sizes=None):
+    """
+    Vectorized fast non-dominated sort of the distinct weighted fitnesses wvalues (rows), stopping once the fronts
+    hold at least k individuals (sizes: the number of individuals sharing each fitness, 1 by default).
+    Returns the fronts as arrays of row indices, in the order of DEAP's sortNondominated.
+    """
+    n = len(wvalues)
+    if n == 0 or k == 0:
+        return []
+    sizes = np.ones(n, dtype=int) if sizes is None else np.asarray(sizes)
+    dominates = dominance_matrix(wvalues)
+    dominators = dominates.sum(axis=0)
+    front = np.flatnonzero(dominators == 0)
+    fronts = [front]
+    sorted_count = sizes[front].sum()
+    while sorted_count < min(sizes.sum(), k):
+        dominated = dominates[front]
+        counts = dominated.sum(axis=0)
+        candidates = np.flatnonzero((dominators > 0) & (dominators == counts))
+        dominators -= counts
+        # DEAP appends a fitness when its last dominator in the current front is processed, in row order
+        last_dominator = len(front) - 1 - np.argmax(dominated[::-1, candidates], axis=0)
+        front = candidates[np.lexsort((candidates, last_dominator))]
+        fronts.append(front)
+        sorted_count += sizes[front].sum()
+    return fronts
+
+
+def crowding_distance(values):
+    """
+    Crowding distance of each row of the fitness values of a front, as DEAP's assignCrowdingDist computes it.
+    """
+    n, nobj = values.shape
+    distances = np.zeros(n)
+    order = np.arange(n)
+    for i in range(nobj):
+        # Stable sorts of the previous order, so that ties are broken as in DEAP
+        order = order[np.argsort(values[order, i], kind="stable")]
+        distances[order[0]] = np.inf
+        distances[order[-1]] = np.inf
+        if values[order[-1], i] == values[order[0], i]:
+            continue
+        norm = nobj * float(values[order[-1], i] - values[order[0], i])
+        distances[order[1:-1]] += (values[order[2:], i] - values[order[:-2], i]) / norm
+    return distances
+
+
+def sel_nsga2(individuals, k):
+    """
+    Drop-in replacement for DEAP's selNSGA2 (same selection, same order), with NumPy non-dominated sorting and
+    crowding distance to scale to large populations.
+    """
+    if not individuals or k == 0:
+        return []
+    # Individuals with the same fitness share the front (as in DEAP's sortNondominated)
+    same_fitness = {}
+    for ind in individuals:
+        same_fitness.setdefault(ind.fitness.wvalues, []).append(ind)
+    fitnesses = list(same_fitness)
+    wvalues = np.array(fitnesses, dtype=float)
+
+    pareto_fronts = []
+    sizes = [len(same_fitness[fitness]) for fitness in fitnesses]
+    for front in sort_nondominated(wvalues, k, sizes):
+        front_individuals = list(chain.from_iterable(same_fitness[fitnesses[i]] for i in front))
+        values = np.array([ind.fitness.values for ind in front_individuals], dtype=float)
+        for ind, distance in zip(front_individuals, crowding_distance(values)):
+            ind.fitness.crowding_dist = float(distance)
+        pareto_fronts.append(front_individuals)
+
+    chosen = list(chain.from_iterable(pareto_fronts[:-1]))
+    k = k - len(chosen)
+    if k > 0:
+        sorted_front = sorted(pareto_fronts[-1], key=attrgetter("fitness.crowding_dist"), reverse=True)
+        chosen.extend(sorted_front[:k])
+    return chosen
@@ -0,0 +1,102 @@
+from collections import deque
+
+from deap import gp
+
+import repair.grammar.utils as grammar_utils
+from repair.fitness.desirability.semanticintegrity import VarTypeConsistencyCheck
+from repair.metrics import metrics
+
+# not(comparison(a, b)) is the dual comparison(a, b), e.g. the robustness of not(a < b) is -(b - a - delta), the one
+# of a >= b
+DUALS = {"lt": "ge", "le": "gt", "gt": "le", "ge": "lt"}
+
+
+def _key(nodes):
+    return str(gp.PrimitiveTree(grammar_utils.canonical(nodes)))
+
+
+def _unit_constant(node, pset, trace_suite):
+    # The kind of constant of the unit of a variable or constant node (None if it has none, e.g. an expression)
+    if grammar_utils.is_constant(node):
+        return node
+    if isinstance(node, gp.Terminal) and node.value in trace_suite.variables:
+        name = f"rand_float_{trace_suite.variables[node.value]['unit']}"
+        return next((terminal for terminal in pset.terminals[node.ret]
+                     if isinstance(terminal, type) and terminal.name == name), None)
+    return None
+
+
+def _rewrite(node, args, pset, trace_suite, arithmetic):
+    """
+    Returns the nodes of the simplification of node(args), each argument being simplified already.
+    arithmetic: whether to simplify additions and subtractions as well.
+    """
+    if node.name == "not":
+        arg, = args
+        if arg[0].name == "not":  # not(not(x)) -> x
+            return arg[1:]
+        if arg[0].name in DUALS:  # not(a < b) -> a >= b
+            return [pset.mapping[DUALS[arg[0].name]]] + arg[1:]
+    elif node.name in ("and", "or"):
+        left, right = args
+        if _key(left) == _key(right):  # x and x -> x
+            return left
+    elif node.name in ("add", "sub") and arithmetic:
+        left, right = args
+        if len(left) == 1 and len(right) == 1 and grammar_utils.is_constant(left[0]) and \
+                grammar_utils.is_constant(right[0]):
+            if type(left[0]) is not type(right[0]):  # constants of different units
+                return [node] + left + right
+            value = left[0].value + right[0].value if node.name == "add" else left[0].value - right[0].value
+            return [grammar_utils.constant(left[0], float(value))]
+        if len(right) == 1 and grammar_utils.is_constant(right[0]) and right[0].value == 0:  # x + 0 -> x
+            return left
+        if node.name == "add" and len(left) == 1 and grammar_utils.is_constant(left[0]) and left[0].value == 0:
+            return right
+        if node.name == "sub" and _key(left) == _key(right):  # x - x -> 0
+            unit_constant = _unit_constant(left[0], pset, trace_suite) if len(left) == 1 else None
+            if unit_constant is None:
+                return [gp.Terminal(0.0, False, node.ret)]
+            return [grammar_utils.constant(unit_constant, 0.0)]
+    return [node] + [n for arg in args for n in arg]
+
+
+def _simplified(tree, pset, trace_suite, arithmetic):
+    def recurse(begin):
+        node = tree[begin]
+        end = begin + 1
+        args = []
+        for _ in range(node.arity):
+            arg, end = recurse(end)
+            args.append(arg)
+        if not args:
+            return [node], end
+        return _rewrite(node, args, pset, trace_suite, arithmetic), end
+
+    nodes, _ = recurse(0)
+    return grammar_utils.canonical(nodes)
+
+
+def _var_type(tree, trace_suite):
+    return VarTypeConsistencyCheck().evaluate_nodes(trace_suite, deque(tree))
+
+
+def simplify(tree, pset, trace_suite):
+    """
+    Simplifies the tree in place, bottom-up, with rewrites keeping its robustness over the trace items (with finite
+    values), and its type: double negations, negated comparisons, idempotent conjunctions and disjunctions, additions
+    and subtractions of zero, of constants (of the same unit) and of an expression to itself. The arguments of
+    commutative functions are then put in canonical order (see grammar.utils.canonical).
+    The arithmetic rewrites are not applied if they change the variable type consistency of the tree (e.g. x - x is a
+    unit mismatch, its simplification 0.0 is not), so that they cannot hide degenerate expressions.
+    Returns the number of nodes removed.
+    """
+    nodes = _simplified(tree, pset, trace_suite, True)
+    if len(nodes) < len(tree) and _var_type(nodes, trace_suite) != _var_type(tree, trace_suite):
+        nodes = _simplified(tree, pset, trace_suite, False)
+    removed = len(tree) - len(nodes)
+    if removed:
+        metrics.count("simplified_nodes", removed)
+    if removed or nodes != list(tree):
+        tree[0:len(tree)] = nodes
+    return removed
@@ -0,0 +1,69 @@
+import logging
+import time
+
+import numpy as np
+from deap.benchmarks.tools import hypervolume
+
+logger = logging.getLogger("gp_logger")
+
+
+class StoppingCriteria:
+    """
+    Stopping criteria of the evolutionary loop, besides the number of generations: a wall-clock budget, a budget of
+    candidate evaluations, and the stagnation of the hall of fame (no hypervolume improvement for a number of
+    generations). Each criterion is disabled when its config value is None (or 0 for the stagnation).
+    """
+
+    def __init__(self, config):
+        self.time_budget = config.time_budget
+        self.evaluation_budget = config.evaluation_budget
+        self.stagnation_generations = config.stagnation_generations
+        self.start_time = time.time()
+        self.reference = None
+        self.best_hypervolume = None
+        self.stagnant_generations = 0
+
+    def set_reference(self, pop):
+        """
+        Fixes the hypervolume reference point, just beyond the worst fitness of the initial population in each
+        objective (all objectives are minimized).
+        """
+        self.reference = np.max([ind.fitness.values for ind in pop], axis=0) + 1.0
+
+    def progress(self):
+        return {"elapsed": time.time() - self.start_time, "reference": self.reference,
+                "best_hypervolume": self.best_hypervolume, "stagnant_generations": self.stagnant_generations}
+
+    def resume(self, progress):
+        """
+        Continues from the progress of a previous run (e.g. from a checkpoint), with the current budgets.
+        """
+        self.start_time = time.time() - progress["elapsed"]
+        self.reference = progress["reference"]
+        self.best_hypervolume = progress["best_hypervolume"]
+        self.stagnant_generations = progress["stagnant_generations"]
+
+    def hypervolume(self, hof):
+        if len(hof) == 0:
+            return 0.0
+        return float(hypervolume(list(hof), self.reference))
+
+    def stop(self, hof, evaluations):
+        """
+        Returns the reason to stop after the current generation, or None.
+        """
+        if self.time_budget is not None and time.time() - self.start_time >= self.time_budget:
+            return f"time budget of {self.time_budget}s reached"
+        if self.evaluation_budget is not None and evaluations >= self.evaluation_budget:
+            return f"evaluation budget of {self.evaluation_budget} candidates reached"
+        if self.stagnation_generations:
+            hv = self.hypervolume(hof)
+            if self.best_hypervolume is None or hv > self.best_hypervolume:
+                self.best_hypervolume = hv
+                self.stagnant_generations = 0
+            else:
+                self.stagnant_generations += 1
+            logger.info(f"  Hypervolume: {hv:.6g} ({self.stagnant_generations} generations without improvement)")
+            if self.stagnant_generations >= self.stagnation_generations:
+                return f"no hypervolume improvement for {self.stagnant_generations} generations"
+        return None
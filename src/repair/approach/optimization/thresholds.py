@@ -0,0 +1,123 @@
+import math
+import random
+from collections import OrderedDict
+
+import numpy as np
+from deap import gp
+
+import repair.grammar.utils as grammar_utils
+from repair.fitness.correctness.utils import is_sat_vectorized
+from repair.grammar.functions import delta
+from repair.metrics import metrics
+
+# comparison(expression, constant) holds, by its robustness function, when the constant is an upper bound of the
+# expression (constant >= value + offset), or a lower bound (constant <= value + offset)
+COMPARISONS = {
+    "lt": (True, delta),  # constant - value - delta >= 0
+    "le": (True, -delta),  # constant - value + delta >= 0
+    "gt": (False, -delta),  # value - constant - delta >= 0
+    "ge": (False, delta),  # value - constant + delta >= 0
+}
+# comparison(constant, expression) is the mirrored comparison(expression, constant), e.g. lt(c, e) is gt(e, c)
+MIRRORED = {"lt": "gt", "le": "ge", "gt": "lt", "ge": "le"}
+
+
+class ThresholdIndex:
+    """
+    Sorted values of float expressions over the trace items where a precondition holds, so that the constant making a
+    comparison hold on a fraction of these items is a lookup, instead of many random constants tried by mutation.
+    Memory-bounded LRU cache of the sorted values, keyed by the (precondition, expression) strings.
+    """
+
+    def __init__(self, trace_suite, compile_fn, max_bytes=64 * 1024 * 1024):
+        self.trace_suite = trace_suite
+        self.compile_fn = compile_fn
+        self.max_bytes = max_bytes
+        self.entries = OrderedDict()
+        self.bytes = 0
+
+    def values(self, pre, expr):
+        """
+        Returns the sorted values of expr over the trace items where pre holds (NaN values excluded).
+        """
+        key = (str(pre), str(expr))
+        values = self.entries.get(key)
+        if values is not None:
+            self.entries.move_to_end(key)
+            return values
+        compiled_pre = self.compile_fn(pre)
+        compiled_expr = self.compile_fn(expr)
+        parts = [compiled_expr.evaluate(trace)[is_sat_vectorized(compiled_pre.evaluate(trace))]
+                 for trace in self.trace_suite.traces]
+        values = np.sort(np.concatenate(parts)) if parts else np.empty(0)
+        values = values[:len(values) - np.count_nonzero(np.isnan(values))]  # sorted last
+        if values.nbytes <= self.max_bytes:
+            self.entries[key] = values
+            self.bytes += values.nbytes
+            while self.bytes > self.max_bytes:
+                _, evicted = self.entries.popitem(last=False)
+                self.bytes -= evicted.nbytes
+        return values
+
+    def threshold(self, pre, expr, upper, offset, fraction):
+        """
+        Returns the constant closest to the values of expr where pre holds, such that constant >= value + offset
+        (upper bound) or constant <= value + offset (lower bound) for the given fraction of them. None if pre holds
+        nowhere.
+        """
+        values = self.values(pre, expr)
+        if not len(values):
+            return None
+        count = min(len(values), max(1, math.ceil(fraction * len(values))))
+        return float((values[count - 1] if upper else values[len(values) - count]) + offset)
+
+
+def _conjuncts(tree, begin=0):
+    # Positions of the conjuncts of the subtree starting at begin (itself, if it is not a conjunction)
+    if tree[begin].name == "and":
+        right = tree.searchSubtree(begin + 1).stop
+        yield from _conjuncts(tree, begin + 1)
+        yield from _conjuncts(tree, right)
+    else:
+        yield begin
+
+
+def threshold_comparisons(tree):
+    """
+    Returns the (position of the constant, slice of the expression, upper, offset) of each comparison between a
+    variable expression and a constant among the conjuncts of the tree (see COMPARISONS).
+    """
+    comparisons = []
+    for begin in _conjuncts(tree):
+        name = tree[begin].name
+        if name not in COMPARISONS:
+            continue
+        left = tree.searchSubtree(begin + 1)
+        right = tree.searchSubtree(left.stop)
+        if grammar_utils.is_constant(tree[right.start]) and right.stop - right.start == 1:
+            constant, expr = right.start, left
+        elif grammar_utils.is_constant(tree[left.start]) and left.stop - left.start == 1:
+            constant, expr, name = left.start, right, MIRRORED[name]
+        else:
+            continue
+        if any(isinstance(node, gp.Terminal) and isinstance(node.value, str) for node in tree[expr]):
+            comparisons.append((constant, expr) + COMPARISONS[name])
+    return comparisons
+
+
+def mut_threshold(individual, index, fraction):
+    """
+    Sets the constant of a random comparison among the conjuncts of the postcondition of the individual, so that the
+    comparison holds on the given fraction of the trace items where the precondition holds, as tightly as possible.
+    Returns whether the postcondition changed.
+    """
+    comparisons = threshold_comparisons(individual.post)
+    if not comparisons:
+        return False
+    constant, expr, upper, offset = random.choice(comparisons)
+    value = index.threshold(individual.pre, gp.PrimitiveTree(individual.post[expr]), upper, offset, fraction)
+    if value is None or value == individual.post[constant].value:
+        return False
+    individual.post[constant] = grammar_utils.constant(individual.post[constant], value)
+    metrics.count("threshold_mutations")
+    return True
@@ -16,7 +16,13 @@ class Requirement:
 
     @staticmethod
     def _set_condition(pset, condition):
-        return gp.PrimitiveTree.from_string(condition, pset) if isinstance(condition, str) else condition
+        if not isinstance(condition, str):
+            return condition
+        tree = gp.PrimitiveTree.from_string(condition, pset)
+        if isinstance(tree[0], gp.Terminal) and tree[0].ret != pset.ret:
+            # A constant condition (e.g. True) is parsed with its Python type, retype it so it can be mutated
+            tree[0] = gp.Terminal(tree[0].value, False, pset.ret)
+        return tree
 
     def get_condition(self, pre_post_id):
         if pre_post_id == 0:
@@ -30,9 +36,21 @@ class Requirement:
     def merged(self):
         return gp.PrimitiveTree([self.implies_primitive] + list(self.pre) + list(self.post))
 
+    @cached_property
+    def compiled_pre(self):
+        return self.toolbox.compile_robustness(self.pre)
+
+    @cached_property
+    def compiled_post(self):
+        return self.toolbox.compile_robustness(self.post)
+
+    @cached_property
+    def compiled_merged(self):
+        return self.toolbox.compile_robustness(self.merged)
+
     @cached_property
     def satisfaction_degrees(self):
-        return self.toolbox.get_sat_deg(self.pre, self.post)
+        return self.toolbox.get_sat_deg(self.compiled_pre, self.compiled_post)
 
     @cached_property
     def correctness(self):
@@ -1,64 +1,294 @@
 import csv
+import json
+import logging
 import os
+import time
 from collections import namedtuple
+from concurrent.futures import ProcessPoolExecutor
+from collections.abc import Mapping, Sequence
 from functools import cached_property
 
+import numpy as np
+import pandas as pd
+
+logger = logging.getLogger("gp_logger")
+
+
+class TraceItemValues(Mapping):
+    """
+    Read-only {variable: value} view over one row of a trace's columnar data.
+    """
+    __slots__ = ("trace", "index")
+
+    def __init__(self, trace, index):
+        self.trace = trace
+        self.index = index
+
+    def __getitem__(self, var):
+        return self.trace.data[self.index, self.trace.suite.var_index[var]]
+
+    def __contains__(self, var):
+        return var in self.trace.suite.var_index
+
+    def __iter__(self):
+        return iter(self.trace.suite.var_index)
+
+    def __len__(self):
+        return len(self.trace.suite.var_index)
+
 
 class TraceItem:
-    def __init__(self, trace, row):
+    """
+    Row view adapter over a trace, for consumers that work one time step at a time.
+    """
+    __slots__ = ("trace", "index")
+
+    def __init__(self, trace, index):
         self.trace = trace
-        self.values = {}
-        for i, (k, v) in enumerate(trace.suite.variables.items()): # dict keeps insertion order
-            value = float(row[i])
-            self.values[k] = value
-            if v["min"] is None or value < v["min"]:
-                v["min"] = value
-            if v["max"] is None or value > v["max"]:
-                v["max"] = value
+        self.index = index
 
-    @cached_property
+    @property
+    def values(self):
+        return TraceItemValues(self.trace, self.index)
+
+    @property
     def time(self):
-        return self.values[self.trace.suite.TIME_VAR]
+        return self.trace.data[self.index, self.trace.suite.var_index[self.trace.suite.TIME_VAR]]
+
+
+class TraceItems(Sequence):
+    __slots__ = ("trace",)
+
+    def __init__(self, trace):
+        self.trace = trace
+
+    def __getitem__(self, i):
+        if isinstance(i, slice):
+            return [TraceItem(self.trace, j) for j in range(*i.indices(len(self)))]
+        if i < 0:
+            i += len(self)
+        if not 0 <= i < len(self):
+            raise IndexError("Trace item index out of range")
+        return TraceItem(self.trace, i)
+
+    def __len__(self):
+        return self.trace.data.shape[0]
+
+
+def read_trace_csv(path):
+    """
+    Parses a trace CSV file into its {variable: unit} header and its data (rows x variables, in file order).
+    """
+    with open(path) as csvfile:
+        header = next(csv.reader(csvfile))
+        units = {var.partition("|")[0]: var.partition("|")[2] for var in header}
+        data = np.loadtxt(csvfile, delimiter=",", dtype=np.float64, ndmin=2)
+    if data.size == 0:
+        data = np.empty((0, len(units)), dtype=np.float64)
+    return units, data
+
+
+class ZoneMap:
+    """
+    Min/max of each variable over consecutive blocks of block_size trace items (the last block may be shorter), so
+    that the robustness of a formula can be bounded over whole blocks without evaluating it item by item.
+    """
+
+    def __init__(self, data, block_size):
+        self.block_size = block_size
+        self.starts = np.arange(0, len(data), block_size)
+        self.ends = np.append(self.starts[1:], len(data))
+        self.mins = np.minimum.reduceat(data, self.starts, axis=0)
+        self.maxs = np.maximum.reduceat(data, self.starts, axis=0)
+
+    def runs(self, blocks):
+        # (first, last + 1) block of each run of consecutive blocks, from a boolean array over the blocks
+        padded = np.concatenate(([False], blocks, [False]))
+        edges = np.flatnonzero(padded[1:] != padded[:-1])
+        return zip(edges[::2].tolist(), edges[1::2].tolist())
+
+    def __len__(self):
+        return len(self.starts)
 
 
 class Trace:
-    def __init__(self, suite, path):
+    def __init__(self, suite, path, data=None, csv_data=None):
+        """
+        data: the columnar data in suite order (e.g. memory-mapped from the binary cache), otherwise the CSV file is
+        parsed; csv_data: the result of read_trace_csv, if the file was already parsed (e.g. by a loader process).
+        """
         self.suite = suite
         self.path = path
-        self.items = []
-        with open(self.path) as csvfile:
-            reader = csv.reader(csvfile)
-            for i, row in enumerate(reader):
-                if i == 0:
-                    variables = {var.partition("|")[0]: {"unit": var.partition("|")[2], "min": None, "max": None}
-                                 for var in row}
-                    if not suite.variables:
-                        if not suite.in_variable_names.issubset(variables.keys()):
-                            raise ValueError("Input variables not found")
-                        suite.variables = variables
-                    else:
-                        if suite.variables.keys() != variables.keys():
-                            raise ValueError("Trace variables do not match across traces")
-                    continue
-                self.items.append(TraceItem(self, row))
+        if data is not None:  # preloaded, variables already known
+            self.data = data
+            self.items = TraceItems(self)
+            return
+        units, data = csv_data if csv_data is not None else read_trace_csv(path)
+        variables = {var: {"unit": unit, "min": None, "max": None} for var, unit in units.items()}
+        if not suite.variables:
+            if not suite.in_variable_names.issubset(variables.keys()):
+                raise ValueError("Input variables not found")
+            suite.variables = variables
+        else:
+            if suite.variables.keys() != variables.keys():
+                raise ValueError("Trace variables do not match across traces")
+        # Store columns in suite order (one contiguous array per variable)
+        columns = list(variables)
+        self.data = np.asfortranarray(data[:, [columns.index(var) for var in suite.variables]])
+        self.items = TraceItems(self)
+        if len(self.data):
+            for var, v_min, v_max in zip(suite.variables.values(), self.data.min(axis=0), self.data.max(axis=0)):
+                if var["min"] is None or v_min < var["min"]:
+                    var["min"] = float(v_min)
+                if var["max"] is None or v_max > var["max"]:
+                    var["max"] = float(v_max)
+
+    def column(self, var):
+        return self.data[:, self.suite.var_index[var]]
+
+    def rows(self, begin, end):
+        # Items [begin, end) as a trace of their own (sharing the data)
+        return Trace(self.suite, self.path, self.data[begin:end])
+
+    @cached_property
+    def zone_map(self):
+        # None for the traces evaluated as a whole
+        block_size = self.suite.ZONE_BLOCK_SIZE
+        if len(self.data) < self.suite.ZONE_MIN_BLOCKS * block_size:
+            return None
+        return ZoneMap(self.data, block_size)
+
+    def __getstate__(self):
+        state = self.__dict__.copy()
+        if isinstance(self.data, np.memmap):
+            # Memory-mapped from the binary cache: the receiving process maps the same file (sharing the page cache)
+            state["data"] = self.data.filename
+        return state
+
+    def __setstate__(self, state):
+        self.__dict__.update(state)
+        if isinstance(self.data, str):
+            self.data = np.load(self.data, mmap_mode="r")
+
+    def to_dataframe(self):
+        return pd.DataFrame(self.data, columns=list(self.suite.variables))
 
 Variable = namedtuple("Variable", ["unit", "min", "max"])
 class TraceSuite:
     TIME_VAR = "Time"
 
-    def __init__(self, path, in_variable_names, prev0):
+    CACHE_DIR = ".trace_cache"
+    CACHE_VERSION = 1
+    PARALLEL_MIN_TRACES = 16  # below this, a process pool costs more than it saves
+    ZONE_BLOCK_SIZE = 256  # trace items per block of the zone maps
+    ZONE_MIN_BLOCKS = 256  # shorter traces are evaluated as a whole, the zone maps would cost more than they save
+
+    def __init__(self, path, in_variable_names, prev0, use_cache=True, workers=None):
+        self.path = path
         self.in_variable_names = in_variable_names
         self.prev0 = prev0
         self.traces = []
         self.variables = {}
+        start_time = time.time()
         with os.scandir(path) as it:
-            for entry in it:
-                if entry.is_dir() or not entry.name.endswith('.csv'):
-                    continue
-                self.traces.append(Trace(self, entry.path))
+            csv_entries = [entry for entry in it if not entry.is_dir() and entry.name.endswith('.csv')]
+        # Sort by name: the trace order must not depend on the file system
+        csv_entries.sort(key=lambda entry: entry.name)
+        if use_cache and self._load_cache(csv_entries):
+            source = "binary cache"
+        else:
+            self._load_csv(csv_entries, workers)
+            if use_cache:
+                self._write_cache(csv_entries)
+            source = "CSV files"
+        self.load_time = time.time() - start_time
+        logger.info(f"Loaded {len(self.traces)} traces from {path} ({source}) in {self.load_time:.2f}s")
+
+    def _load_csv(self, csv_entries, workers=None):
+        paths = [entry.path for entry in csv_entries]
+        if workers == 1 or len(paths) < self.PARALLEL_MIN_TRACES:
+            self.traces = [Trace(self, path) for path in paths]
+            return
+        # Parse in a process pool, then merge variables and min/max (and validate them) in order
+        with ProcessPoolExecutor(max_workers=workers) as executor:
+            chunksize = max(1, len(paths) // (4 * (workers or os.cpu_count())))
+            csv_data = executor.map(read_trace_csv, paths, chunksize=chunksize)
+            self.traces = [Trace(self, path, csv_data=data) for path, data in zip(paths, csv_data)]
+
+    @staticmethod
+    def _csv_stamp(entry):
+        stat = entry.stat()
+        return {"mtime_ns": stat.st_mtime_ns, "size": stat.st_size}
+
+    def _load_cache(self, csv_entries):
+        """
+        Loads the traces from the binary cache (one memory-mapped .npy file per trace, plus a JSON header), if it is
+        still valid for the current CSV files. Returns True on success.
+        """
+        cache_dir = os.path.join(self.path, self.CACHE_DIR)
+        try:
+            with open(os.path.join(cache_dir, "header.json")) as header_file:
+                header = json.load(header_file)
+            if header["version"] != self.CACHE_VERSION:
+                return False
+            if header["traces"] != {entry.name: self._csv_stamp(entry) for entry in csv_entries}:
+                return False  # CSV files added, removed or changed
+            traces = []
+            for entry in csv_entries:
+                data = np.load(os.path.join(cache_dir, f"{entry.name}.npy"), mmap_mode="r")
+                traces.append((entry.path, data))
+        except (OSError, KeyError, ValueError) as e:
+            logger.info(f"Trace cache not usable ({e}), parsing CSV files")
+            return False
+        if not set(self.in_variable_names).issubset(header["variables"].keys()):
+            raise ValueError("Input variables not found")
+        self.variables = header["variables"]
+        self.traces = [Trace(self, path, data) for path, data in traces]
+        return True
+
+    def _write_cache(self, csv_entries):
+        cache_dir = os.path.join(self.path, self.CACHE_DIR)
+        try:
+            os.makedirs(cache_dir, exist_ok=True)
+            for entry, trace in zip(csv_entries, self.traces):
+                # write to temporary files and rename, so that concurrent readers never see partial files
+                tmp_path = os.path.join(cache_dir, f"{entry.name}.{os.getpid()}.tmp.npy")
+                np.save(tmp_path, trace.data)
+                os.replace(tmp_path, os.path.join(cache_dir, f"{entry.name}.npy"))
+            header = {
+                "version": self.CACHE_VERSION,
+                "variables": self.variables,
+                "traces": {entry.name: self._csv_stamp(entry) for entry in csv_entries},
+            }
+            tmp_path = os.path.join(cache_dir, f"header.json.{os.getpid()}.tmp")
+            with open(tmp_path, "w") as header_file:
+                json.dump(header, header_file)
+            os.replace(tmp_path, os.path.join(cache_dir, "header.json"))
+        except OSError as e:
+            logger.info(f"Could not write the trace cache ({e})")
+
+    @cached_property
+    def var_index(self):
+        # Column of each variable in the traces' data arrays
+        return {var: i for i, var in enumerate(self.variables)}
 
     @cached_property
     def variable_names(self):
         # Start with in_variable_names, then add the rest (excluding TIME_VAR and already included)
         rest = [v for v in self.variables if v != self.TIME_VAR and v not in self.in_variable_names]
         return list(self.in_variable_names) + sorted(rest)
+
+
+_trace_suites = {}
+
+
+def get_trace_suite(path, in_variable_names, prev0):
+    """
+    Returns the trace suite of the directory, loaded once per process: the runs executed by the same process (e.g. a
+    worker of bin/evaluation.py) share it, and processes share its memory-mapped binary cache.
+    """
+    key = (os.path.abspath(path), frozenset(in_variable_names), prev0)
+    suite = _trace_suites.get(key)
+    if suite is None:
+        suite = _trace_suites[key] = TraceSuite(path, in_variable_names, prev0)
+    return suite
@@ -0,0 +1,276 @@
+from functools import cached_property
+
+import numpy as np
+from deap import gp
+
+from repair.grammar.grammar import ROBUSTNESS_FN_MAP, VECTORIZED_ROBUSTNESS_FN_MAP, INTERVAL_ROBUSTNESS_FN_MAP, \
+    COMMUTATIVE_FUNCTIONS
+
+
+class CompiledTree:
+    """
+    A GP tree compiled once into closures, so that evaluating it does not interpret the node list again.
+    Variables are resolved to columns of the trace data and robustness functions are bound at compile time.
+    With a SubtreeCache, the robustness vector of each subtree is shared with the other trees holding it.
+    """
+
+    def __init__(self, tree, trace_suite, cache=None):
+        self.tree = tree
+        self.trace_suite = trace_suite
+        self.cache = cache
+
+    @cached_property
+    def vectorized(self):
+        # fn(trace) -> robustness of all trace items (array, or scalar for constant subtrees)
+        return _compile_vectorized(self.tree, self.trace_suite, self.cache)
+
+    @cached_property
+    def scalar(self):
+        # fn(trace, i) -> robustness of the i-th trace item
+        return _compile_scalar(iter(self.tree), self.trace_suite)
+
+    @cached_property
+    def bounds(self):
+        # fn(zone_map) -> (lower, upper) robustness bounds of each block, None if the tree cannot be bounded
+        try:
+            return _compile_bounds(iter(self.tree), self.trace_suite)
+        except NotImplementedError:
+            return None
+
+    @cached_property
+    def uncached(self):
+        # Same as vectorized, for parts of traces that must not go through the subtree cache
+        return _compile_vectorized(self.tree, self.trace_suite)
+
+    def evaluate(self, trace) -> np.ndarray:
+        return np.broadcast_to(self.vectorized(trace), len(trace.items))
+
+    def evaluate_rows(self, trace, begin, end) -> np.ndarray:
+        """
+        Evaluates the trace items [begin, end) only, after the item preceding them for prev: trees that can be bounded
+        do not look further back.
+        """
+        context = 1 if begin > 0 else 0
+        values = self.uncached(trace.rows(begin - context, end))
+        return np.broadcast_to(values, end - begin + context)[context:]
+
+    def evaluate_item(self, trace, i) -> float:
+        return self.scalar(trace, i)
+
+    def __str__(self):
+        return str(self.tree)
+
+
+def compile_tree(tree, trace_suite, cache=None) -> CompiledTree:
+    if isinstance(tree, CompiledTree):
+        return tree
+    return CompiledTree(tree, trace_suite, cache)
+
+
+def _compile_terminal(node, trace_suite):
+    """
+    Returns (column index, None) for variables, (None, constant) otherwise.
+    """
+    value = node.value
+    # True/False booleans (we never generate them when repairing, but could be in the input requirement)
+    if isinstance(value, bool):
+        return None, 0.0 if value else float("-inf")
+    # Number
+    if isinstance(value, (float, int)):
+        return None, value
+    # Variable
+    if value.startswith("_"):  # Variable from the prev primitive (starts with underscore)
+        value = value[1:]
+    if value in trace_suite.var_index:
+        return trace_suite.var_index[value], None
+    # Something went wrong
+    raise ValueError(f"Unrecognized terminal: {node}, name={node.name}, value={value}")
+
+
+def _compile_vectorized(tree, trace_suite, cache=None):
+    """
+    Returns fn(trace). With a cache, subtrees compiled before (e.g. the parts an offspring inherited from its parent)
+    are reused as they are: only the novel subtrees and the path from them to the root are compiled, and evaluating
+    the reused subtrees is a lookup of their robustness vectors.
+    """
+    keys = _subtree_keys(tree) if cache is not None else None
+    fn, _ = _compile_vectorized_at(tree, 0, trace_suite, cache, keys)
+    return fn
+
+
+def _subtree_keys(tree):
+    """
+    Returns the (string form, end index) of the subtree starting at each position of the tree.
+    The arguments of commutative functions are in string order, so that e.g. a and b shares the vectors of b and a.
+    """
+    keys = [None] * len(tree)
+    stack = []  # positions of the subtrees following the current node, first one on top
+    for i in reversed(range(len(tree))):
+        node = tree[i]
+        children = [stack.pop() for _ in range(node.arity)]
+        args = [keys[c][0] for c in children]
+        if node.name in COMMUTATIVE_FUNCTIONS:
+            args.sort()
+        keys[i] = (node.format(*args), keys[children[-1]][1] if children else i + 1)
+        stack.append(i)
+    return keys
+
+
+def _compile_vectorized_at(tree, begin, trace_suite, cache, keys):
+    """
+    Returns (fn, end) for the subtree starting at the begin position of the tree.
+    """
+    node = tree[begin]
+    if isinstance(node, gp.Terminal):
+        col, const = _compile_terminal(node, trace_suite)
+        if col is None:
+            return (lambda trace: const), begin + 1
+        return (lambda trace: trace.data[:, col]), begin + 1
+
+    elif isinstance(node, gp.Primitive):
+        if cache is not None:
+            key, end = keys[begin]
+            fn = cache.function(key)
+            if fn is not None:
+                return fn, end
+        children = []
+        end = begin + 1
+        for _ in range(node.arity):
+            child, end = _compile_vectorized_at(tree, end, trace_suite, cache, keys)
+            children.append(child)
+        fn = _compile_vectorized_primitive(node, children, trace_suite)
+        if cache is not None:
+            fn = cache.add_function(key, fn)
+        return fn, end
+
+    else:
+        raise TypeError(f"Unexpected node type: {node}")
+
+
+def _compile_vectorized_primitive(node, children, trace_suite):
+    if node.name == "prev":  # prev(_var)
+        child, = children
+        prev0 = trace_suite.prev0
+
+        def prev(trace):
+            values = np.broadcast_to(child(trace), len(trace.items))
+            prev_values = np.empty(len(values))
+            prev_values[1:] = values[:-1]
+            prev_values[:1] = prev0  # no previous trace item
+            return prev_values
+        return prev
+    elif node.name == "dur":  # dur(time, Bool)
+        dur_fn, cor_fn = children
+        time_col = trace_suite.var_index[trace_suite.TIME_VAR]
+
+        def dur(trace):
+            n = len(trace.items)
+            times = trace.data[:, time_col]
+            durs = np.broadcast_to(dur_fn(trace), n)
+            cors = np.broadcast_to(cor_fn(trace), n)
+            cor_dur = np.full(n, float("inf"))
+            for i in range(n):
+                # walk back while the item is within the duration window, keep min (worst)
+                i_dur = i
+                while i_dur >= 0 and durs[i] > times[i] - times[i_dur]:
+                    i_dur -= 1
+                if i_dur < i:
+                    cor_dur[i] = cors[i_dur+1:i+1].min()
+            return cor_dur
+        return dur
+    else:
+        rob_fn = VECTORIZED_ROBUSTNESS_FN_MAP.get(node.name)
+        if rob_fn is None:
+            raise NotImplementedError(f"No robustness function defined for {node.name}")
+        if node.arity == 1:
+            child, = children
+            return lambda trace: rob_fn(child(trace))
+        if node.arity == 2:
+            left, right = children
+            return lambda trace: rob_fn(left(trace), right(trace))
+        return lambda trace: rob_fn(*[child(trace) for child in children])
+
+
+def _compile_scalar(nodes, trace_suite):
+    node = next(nodes)
+    if isinstance(node, gp.Terminal):
+        col, const = _compile_terminal(node, trace_suite)
+        if col is None:
+            return lambda trace, i: const
+        return lambda trace, i: trace.data[i, col]
+
+    elif isinstance(node, gp.Primitive):
+        if node.name == "prev":  # prev(_var)
+            child = _compile_scalar(nodes, trace_suite)
+            prev0 = trace_suite.prev0
+            return lambda trace, i: child(trace, i-1) if i > 0 else prev0
+        elif node.name == "dur":  # dur(time, Bool)
+            dur_fn = _compile_scalar(nodes, trace_suite)
+            cor_fn = _compile_scalar(nodes, trace_suite)
+            time_col = trace_suite.var_index[trace_suite.TIME_VAR]
+
+            def dur(trace, i):
+                time = dur_fn(trace, i)
+                cor_dur = float("inf")
+                i_dur = i
+                while i_dur >= 0 and time > trace.data[i, time_col] - trace.data[i_dur, time_col]:
+                    cor_dur = min(cor_dur, cor_fn(trace, i_dur))  # keep min (worst)
+                    i_dur -= 1
+                return cor_dur
+            return dur
+        else:
+            children = [_compile_scalar(nodes, trace_suite) for _ in range(node.arity)]
+            rob_fn = ROBUSTNESS_FN_MAP.get(node.name)
+            if rob_fn is None:
+                raise NotImplementedError(f"No robustness function defined for {node.name}")
+            if node.arity == 1:
+                child, = children
+                return lambda trace, i: rob_fn(child(trace, i))
+            if node.arity == 2:
+                left, right = children
+                return lambda trace, i: rob_fn(left(trace, i), right(trace, i))
+            return lambda trace, i: rob_fn(*[child(trace, i) for child in children])
+
+    else:
+        raise TypeError(f"Unexpected node type: {node}")
+
+
+def _compile_bounds(nodes, trace_suite):
+    """
+    Returns fn(zone_map) -> (lower, upper), bounding the robustness over each block of the zone map with interval
+    arithmetic. Raises NotImplementedError for nodes without interval semantics (e.g. dur).
+    """
+    node = next(nodes)
+    if isinstance(node, gp.Terminal):
+        col, const = _compile_terminal(node, trace_suite)
+        if col is None:
+            return lambda zone_map: (const, const)
+        return lambda zone_map: (zone_map.mins[:, col], zone_map.maxs[:, col])
+
+    elif isinstance(node, gp.Primitive):
+        if node.name == "prev":  # prev(_var)
+            child = _compile_bounds(nodes, trace_suite)
+            prev0 = trace_suite.prev0
+
+            def prev(zone_map):
+                # The items of a block are preceded by the block itself and the last item of the previous block
+                # (prev0 for the first block)
+                lower, upper = (np.broadcast_to(b, len(zone_map)) for b in child(zone_map))
+                return (np.minimum(lower, np.concatenate(([prev0], lower[:-1]))),
+                        np.maximum(upper, np.concatenate(([prev0], upper[:-1]))))
+            return prev
+        else:
+            children = [_compile_bounds(nodes, trace_suite) for _ in range(node.arity)]
+            interval_fn = INTERVAL_ROBUSTNESS_FN_MAP.get(node.name)
+            if interval_fn is None:
+                raise NotImplementedError(f"No interval robustness function defined for {node.name}")
+            if node.arity == 1:
+                child, = children
+                return lambda zone_map: interval_fn(child(zone_map))
+            if node.arity == 2:
+                left, right = children
+                return lambda zone_map: interval_fn(left(zone_map), right(zone_map))
+            return lambda zone_map: interval_fn(*[child(zone_map) for child in children])
+
+    else:
+        raise TypeError(f"Unexpected node type: {node}")
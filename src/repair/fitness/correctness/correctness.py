@@ -1,7 +1,11 @@
 from collections import deque
 import logging
 
-from repair.fitness.correctness.utils import is_within_margin, eval_nodes
+import numpy as np
+
+from repair.fitness.correctness.compiler import compile_tree
+from repair.fitness.correctness.utils import is_within_margin, is_sat_vectorized, eval_nodes
+from repair.metrics import metrics
 
 logger = logging.getLogger("gp_logger")
 
@@ -14,74 +18,181 @@ def get_fitness_correctness(satisfaction_degrees=None):
     return fitness
 
 
-def get_satisfaction_degrees(precondition, postcondition, trace_suite):
+def is_sat(sd):
+    return sd >= 0.0 or is_within_margin(sd, 0.0)
 
-    def is_sat(sd):
-        return sd >= 0.0 or is_within_margin(sd, 0.0)
 
-    # print("Running get_satisfaction_degrees on: ", precondition, " => ", postcondition)
+class KillerTraces:
+    """
+    Counts how many candidates each trace falsified, so that the traces falsifying the most candidates (the "killer"
+    traces) are checked first by the bounded trace checking.
+    """
 
-    ts_pre_sd = float("inf")
-    ts_post_sd = float("inf")
-    ts_impl_sd = float("inf")
+    def __init__(self, count):
+        self.falsified = [0] * count
 
-    t_count_pre_sat = 0
-    t_count_post_sat = 0
-    t_count_impl_sat = 0
-    t_count_total = len(trace_suite.traces)
+    def order(self):
+        return sorted(range(len(self.falsified)), key=lambda i: -self.falsified[i])
 
-    item_count_pre_sat = 0
-    item_count_post_sat = 0
-    item_count_impl_sat = 0
-    item_count_total = 0
-    try:
-        all_nodes_pre = deque(iter(precondition))
-        all_nodes_post = deque(iter(postcondition))
-        # For each trace, ...
-        logger.info(f"    Trace checking:  {precondition}   =>   {postcondition}")
-        for trace in trace_suite.traces:
-            item_count_total += len(trace.items)
+    def record(self, index):
+        self.falsified[index] += 1
 
-            t_pre_sd = float("inf")
-            t_post_sd = float("inf")
-            t_impl_sd = float("inf")
 
-            # ... at each time stamp, ...
-            for i, item in enumerate(trace.items):
-                # ... does PRE hold? ...
-                item_pre_sd = eval_nodes(deque(all_nodes_pre), i, item)
-                item_count_pre_sat += 1 if is_sat(item_pre_sd) else 0
+ZONE_MAX_EVALUATED = 0.5  # fraction of the blocks of a trace where PRE and POST are evaluated, at most
 
-                t_pre_sd = min(t_pre_sd, item_pre_sd)
-                ts_pre_sd = min(ts_pre_sd, item_pre_sd)
 
-                # ... does POST hold?
-                item_post_sd = eval_nodes(deque(all_nodes_post), i, item)
-                item_count_post_sat += 1 if is_sat(item_post_sd) else 0
+def _sd_stats(sd):
+    # (min satisfaction degree, # of satisfied items)
+    return float(sd.min(initial=float("inf"))), int(np.count_nonzero(is_sat_vectorized(sd)))
 
-                t_post_sd = min(t_post_sd, item_post_sd)
-                ts_post_sd = min(ts_post_sd, item_post_sd)
 
-                # ... does PRE=>POST hold?
-                item_impl_sd = max(-item_pre_sd, item_post_sd)
-                item_count_impl_sat += 1 if is_sat(item_impl_sd) else 0
+def check_trace(compiled_pre, compiled_post, trace):
+    """
+    Returns the (min satisfaction degree, # of satisfied items) of PRE, POST and PRE=>POST over the trace.
+    """
+    if trace.zone_map is not None and compiled_pre.bounds is not None and compiled_post.bounds is not None:
+        sd_stats = _check_trace_blocks(compiled_pre, compiled_post, trace)
+        if sd_stats is not None:
+            return sd_stats
+    # ... does PRE hold? does POST hold? does PRE=>POST hold?
+    pre_sd = compiled_pre.evaluate(trace)
+    post_sd = compiled_post.evaluate(trace)
+    impl_sd = np.maximum(-pre_sd, post_sd)
+    return [_sd_stats(sd) for sd in (pre_sd, post_sd, impl_sd)]
+
+
+def _check_trace_blocks(compiled_pre, compiled_post, trace):
+    """
+    Same as check_trace, evaluating PRE and POST only over the blocks of the trace zone map where their statistics are
+    not settled by interval arithmetic. A formula is settled over a block if its bounds prove that all the items of
+    the block satisfy it, or that none does (e.g. PRE is violated throughout the block, and PRE=>POST then holds), and
+    if the block cannot hold its minimum, which is exact. Returns None if too few evaluations can be skipped.
+    """
+    zone_map = trace.zone_map
+    pre_lower, pre_upper = (np.broadcast_to(b, len(zone_map)) for b in compiled_pre.bounds(zone_map))
+    post_lower, post_upper = (np.broadcast_to(b, len(zone_map)) for b in compiled_post.bounds(zone_map))
+    impl_lower, impl_upper = np.maximum(-pre_upper, post_lower), np.maximum(-pre_lower, post_upper)
+    lowers = (pre_lower, post_lower, impl_lower)
+    # is_sat_vectorized is False for NaN bounds, which prove nothing either way
+    all_sat = [is_sat_vectorized(lower) for lower in lowers]
+    settled = [sat | (upper < -1e-6) for sat, upper in zip(all_sat, (pre_upper, post_upper, impl_upper))]
+    # PRE and POST are evaluated where they are not settled, as well as where PRE=>POST is not
+    requested = [~settled[0] | ~settled[2], ~settled[1] | ~settled[2]]
+    if np.count_nonzero(requested[0]) + np.count_nonzero(requested[1]) > 2 * ZONE_MAX_EVALUATED * len(zone_map):
+        return None  # not worth evaluating by blocks
+
+    # For PRE, POST and PRE=>POST: blocks where the formula is evaluated (PRE=>POST wherever PRE and POST are), with
+    # the min satisfaction degree and the # of satisfied items of each of them
+    known = [np.zeros(len(zone_map), dtype=bool) for _ in range(3)]
+    block_min = [np.full(len(zone_map), float("inf")) for _ in range(3)]
+    block_sat = [np.zeros(len(zone_map), dtype=np.int64) for _ in range(3)]
+    sd = [np.empty(len(trace.items)), np.empty(len(trace.items))]
+
+    def add_blocks(i, first, last, values):
+        offsets = zone_map.starts[first:last] - zone_map.starts[first]
+        block_min[i][first:last] = np.minimum.reduceat(values, offsets)
+        block_sat[i][first:last] = np.add.reduceat(is_sat_vectorized(values), offsets)
+        known[i][first:last] = True
+
+    def evaluate_blocks(i, blocks):
+        for j, compiled in ((0, compiled_pre), (1, compiled_post)):
+            if i == j or i == 2:
+                todo = blocks & ~known[j]
+                for first, last in (zone_map.runs(todo) if todo.any() else ()):
+                    begin, end = zone_map.starts[first], zone_map.ends[last - 1]
+                    sd[j][begin:end] = compiled.evaluate_rows(trace, begin, end)
+                    add_blocks(j, first, last, sd[j][begin:end])
+        for first, last in zone_map.runs(known[0] & known[1] & ~known[2]):
+            begin, end = zone_map.starts[first], zone_map.ends[last - 1]
+            add_blocks(2, first, last, np.maximum(-sd[0][begin:end], sd[1][begin:end]))
+
+    def min_sd(i):
+        return np.min(block_min[i], where=known[i], initial=float("inf"))
+
+    evaluate_blocks(0, requested[0])
+    evaluate_blocks(1, requested[1])
+    # Settled blocks that might hold a minimum: first the block with the lowest bound, then all the blocks still below
+    # the minimum (which only decreases, so that the blocks left can be skipped)
+    for i, lower in enumerate(lowers):
+        candidates = np.flatnonzero(~known[i])
+        if not len(candidates):
+            continue
+        lowest = candidates[np.argmin(lower[candidates])]
+        if not lower[lowest] >= min_sd(i):  # NaN bounds prove nothing
+            evaluate_blocks(i, np.arange(len(zone_map)) == lowest)
+        below = ~known[i] & ~(lower >= min_sd(i))
+        if below.any():
+            evaluate_blocks(i, below)
+
+    sizes = zone_map.ends - zone_map.starts
+    metrics.count("zone_blocks", 2 * len(zone_map))
+    metrics.count("zone_blocks_skipped", int(np.count_nonzero(~known[0]) + np.count_nonzero(~known[1])))
+    return [(float(min_sd(i)), int(block_sat[i][known[i]].sum() + sizes[~known[i] & all_sat[i]].sum()))
+            for i in range(3)]
+
+
+def get_satisfaction_degrees(precondition, postcondition, trace_suite, max_correctness=None, killer_traces=None):
+    """
+    max_correctness: if given, trace checking stops as soon as the correctness fitness of the candidate is proven
+    larger (i.e. worse). The satisfaction degrees then only cover the traces checked so far and are flagged as
+    "bounded": their minimum is an upper bound of the real one, hence the correctness fitness a lower bound.
+    killer_traces: if given, traces are checked from the one that falsified the most candidates (and the traces
+    falsifying this candidate are recorded).
+    """
 
-                t_impl_sd = min(t_impl_sd, item_impl_sd)
-                ts_impl_sd = min(ts_impl_sd, item_impl_sd)
+    # print("Running get_satisfaction_degrees on: ", precondition, " => ", postcondition)
 
-            # Measure trace-level stats
-            t_count_pre_sat += 1 if is_sat(t_pre_sd) else 0
-            t_count_post_sat += 1 if is_sat(t_post_sd) else 0
-            t_count_impl_sat += 1 if is_sat(t_impl_sd) else 0
+    # [min satisfaction degree, # of satisfied items, # of satisfied traces] across the trace suite
+    ts_pre = [float("inf"), 0, 0]
+    ts_post = [float("inf"), 0, 0]
+    ts_impl = [float("inf"), 0, 0]
 
-    except Exception as e:
-        raise ValueError(f"Error evaluating: {precondition} => {postcondition} | {e}")
+    t_count_total = 0
+    item_count_total = 0
+    bounded = False
+    order = range(len(trace_suite.traces)) if killer_traces is None else killer_traces.order()
+    with metrics.timer("trace_checking"):
+        try:
+            compiled_pre = compile_tree(precondition, trace_suite)
+            compiled_post = compile_tree(postcondition, trace_suite)
+            # For each trace, evaluate all time stamps at once
+            logger.info("    Trace checking:  %s   =>   %s", precondition, postcondition)
+            for index in order:
+                if max_correctness is not None and -ts_impl[0] > max_correctness:
+                    bounded = True
+                    break
+                trace = trace_suite.traces[index]
+                n = len(trace.items)
+                t_count_total += 1
+                item_count_total += n
+
+                pre_check, post_check, impl_check = check_trace(compiled_pre, compiled_post, trace)
+                for (t_sd, item_count_sat), ts_stats in ((pre_check, ts_pre), (post_check, ts_post),
+                                                         (impl_check, ts_impl)):
+                    ts_stats[0] = min(ts_stats[0], t_sd)
+                    ts_stats[1] += item_count_sat
+                    # Measure trace-level stats
+                    ts_stats[2] += 1 if is_sat(t_sd) else 0
+                impl_sd, _ = impl_check
+                if killer_traces is not None and not is_sat(impl_sd):
+                    killer_traces.record(index)
+
+        except Exception as e:
+            raise ValueError(f"Error evaluating: {precondition} => {postcondition} | {e}")
+
+    def stats(ts_sd, item_count_sat, t_count_sat):
+        return (ts_sd, item_count_sat / item_count_total, item_count_total - item_count_sat,
+                t_count_sat / t_count_total, t_count_total - t_count_sat)
 
     out = {
-        "sd": (ts_impl_sd, item_count_impl_sat / item_count_total, item_count_total - item_count_impl_sat, t_count_impl_sat/t_count_total, t_count_total - t_count_impl_sat),
-        "pre_sd": (ts_pre_sd, item_count_pre_sat / item_count_total, item_count_total - item_count_pre_sat, t_count_pre_sat/t_count_total, t_count_total - t_count_pre_sat),
-        "post_sd": (ts_post_sd, item_count_post_sat / item_count_total, item_count_total - item_count_post_sat, t_count_post_sat/t_count_total, t_count_total - t_count_post_sat),
+        "sd": stats(*ts_impl),
+        "pre_sd": stats(*ts_pre),
+        "post_sd": stats(*ts_post),
     }
+    if bounded:
+        out["bounded"] = True
+        metrics.count("trace_checking_bounded")
+        metrics.count("traces_skipped", len(trace_suite.traces) - t_count_total)
     return out
 
 
@@ -0,0 +1,90 @@
+import threading
+from collections import OrderedDict
+
+import numpy as np
+
+
+class SubtreeCache:
+    """
+    Memory-bounded LRU cache of subtree robustness vectors, shared across the population.
+    Subtrees are hash-consed by their string form, so that identical subtrees of different candidates (e.g. the
+    blocks inherited from the original requirement) are evaluated once per trace.
+    The compiled function of each subtree is kept as well, so that compiling a candidate only compiles its novel
+    subtrees.
+    """
+
+    def __init__(self, max_bytes=256 * 1024 * 1024, max_functions=100000):
+        self.max_bytes = max_bytes
+        self.max_functions = max_functions
+        self.entries = OrderedDict()
+        self.functions = OrderedDict()
+        self.bytes = 0
+        self.hits = 0
+        self.misses = 0
+        self.lock = threading.Lock()
+
+    def function(self, key):
+        """
+        Returns the compiled function of the subtree identified by key, or None.
+        """
+        with self.lock:
+            fn = self.functions.get(key)
+            if fn is not None:
+                self.functions.move_to_end(key)
+            return fn
+
+    def add_function(self, key, compute):
+        """
+        Wraps the compiled function of a subtree so that it goes through the cache, and keeps it for reuse.
+        """
+        def fn(trace):
+            return self.get(key, trace, compute)
+        with self.lock:
+            fn = self.functions.setdefault(key, fn)
+            while len(self.functions) > self.max_functions:
+                self.functions.popitem(last=False)
+        return fn
+
+    def get(self, key, trace, compute):
+        """
+        Returns the robustness vector of the subtree identified by key on the trace, computing it on a miss.
+        """
+        entry_key = (key, trace.path)
+        with self.lock:
+            values = self.entries.get(entry_key)
+            if values is not None:
+                self.entries.move_to_end(entry_key)
+                self.hits += 1
+                return values
+            self.misses += 1
+        values = compute(trace)
+        # Constant subtrees evaluate to scalars, which are not worth caching
+        if isinstance(values, np.ndarray) and 0 < values.nbytes <= self.max_bytes:
+            values.flags.writeable = False  # shared across candidates
+            self._put(entry_key, values)
+        return values
+
+    def _put(self, entry_key, values):
+        with self.lock:
+            old = self.entries.pop(entry_key, None)
+            if old is not None:
+                self.bytes -= old.nbytes
+            self.entries[entry_key] = values
+            self.bytes += values.nbytes
+            while self.bytes > self.max_bytes:
+                _, evicted = self.entries.popitem(last=False)
+                self.bytes -= evicted.nbytes
+
+    def clear(self):
+        with self.lock:
+            self.entries.clear()
+            self.functions.clear()
+            self.bytes = 0
+
+    @property
+    def hit_rate(self):
+        lookups = self.hits + self.misses
+        return self.hits / lookups if lookups else 0.0
+
+    def __len__(self):
+        return len(self.entries)
@@ -3,12 +3,18 @@ from collections import deque
 
 from deap import gp
 from repair.grammar.grammar import ROBUSTNESS_FN_MAP
+from repair.fitness.correctness.compiler import compile_tree
+import numpy as np
 import pandas as pd
 
 
 def is_within_margin(a, b):
     return math.isclose(a, b, abs_tol=1e-6)
 
+def is_sat_vectorized(sd):
+    # same as sd >= 0.0 or is_within_margin(sd, 0.0), element-wise
+    return (sd >= 0.0) | (np.abs(sd) <= 1e-6)
+
 # Fitness function: count how many time steps FAIL the requirement
 def get_trace_correctness(precondition, postcondition, trace_suite):
     """
@@ -24,42 +30,24 @@ def get_trace_correctness(precondition, postcondition, trace_suite):
     """
     results = {}
     try:
+        compiled_pre = compile_tree(precondition, trace_suite)
+        compiled_post = compile_tree(postcondition, trace_suite)
         data = []
         for j, trace in enumerate(trace_suite.traces):
-            delta_cor = 0.0
-            count_cor = 0
             count_total = len(trace.items)
-            all_nodes_pre = deque(iter(precondition))
-            all_nodes_post = deque(iter(postcondition))
-            violating_indices = []
-            violating_times = []
-            for i, item in enumerate(trace.items):
-                # ... does precondition hold? ...
-                pre_rob = min(0.0, eval_nodes(deque(all_nodes_pre), i, item))
-                if is_within_margin(pre_rob, 0.0):
-                    # (pre holds)
-                    # ... does postcondition hold?
-                    post_rob = min(0.0, eval_nodes(deque(all_nodes_post), i, item))
-                    delta_cor += post_rob
-                    if is_within_margin(post_rob, 0.0):
-                        # (post holds)
-                        # (pre=>post holds)
-                        count_cor += 1
-                    else:
-                        # (pre holds, post fails)
-                        violating_indices.append(i)
-                        violating_times.append(item.time)
-                else:
-                    # (pre does not hold)
-                    # (pre=>post trivially holds)
-                    delta_cor += 0.0
-                    count_cor += 1
+            # ... does precondition hold? ...
+            pre_rob = np.minimum(0.0, compiled_pre.evaluate(trace))
+            pre_holds = np.abs(pre_rob) <= 1e-6
+            # ... does postcondition hold? (pre does not hold => pre=>post trivially holds)
+            post_rob = np.where(pre_holds, np.minimum(0.0, compiled_post.evaluate(trace)), 0.0)
+            post_holds = np.abs(post_rob) <= 1e-6
+            violating_indices = np.flatnonzero(pre_holds & ~post_holds)
             data.append({
                 "trace_index": j,
-                "delta_cor": delta_cor,
-                "perc_cor": count_cor / count_total,
-                "violating_indices": violating_indices,
-                "violating_times": violating_times
+                "delta_cor": float(post_rob.sum()),
+                "perc_cor": (count_total - len(violating_indices)) / count_total,
+                "violating_indices": violating_indices.tolist(),
+                "violating_times": trace.column(trace_suite.TIME_VAR)[violating_indices].tolist()
             })
             results = pd.DataFrame(data)
     except Exception as e:
@@ -115,4 +103,4 @@ def eval_nodes(remaining_nodes, i, item) -> float | int:
             return rob_fn(*children)
 
     else:
-        raise TypeError(f"Unexpected node type: {node}")
\ No newline at end of file
+        raise TypeError(f"Unexpected node type: {node}")
@@ -14,12 +14,19 @@ class SemanticIntegrity(ABC):
         """
         pass
 
+    def prefetch(self, trace_suite:TraceSuite, individual:gp.PrimitiveTree):
+        """
+        Optionally starts evaluating in the background, evaluate() then waits for the result
+        """
+        pass
+
 
 class SyntacticSimilarity(ABC):
     @abstractmethod
-    def evaluate(self, individual:gp.PrimitiveTree, original:gp.PrimitiveTree) -> float:
+    def evaluate(self, individual:gp.PrimitiveTree, original:gp.PrimitiveTree, max_fitness:float=None) -> float:
         """
-        Return a distance in [0, 1]
+        Return a distance in [0, 1]; if it is larger than max_fitness, a lower bound of it larger than max_fitness
+        can be returned instead
         """
         pass
 
@@ -32,6 +39,12 @@ class SatisfactionExtent(ABC):
         """
         pass
 
+    def lower_bound(self, correctness) -> float:
+        """
+        Lower bound of the distance of any requirement with this correctness fitness
+        """
+        return 0.0
+
     
 class Desirability:
     def __init__(self,
@@ -53,6 +66,16 @@ class Desirability:
 
         self.num_active_dimensions = sum(1 for w in self.weights if w > 0)
 
+    def __getstate__(self):
+        # The initial requirement is bound to a toolbox, the owning approach sets it again
+        state = self.__dict__.copy()
+        state["initial_requirement"] = None
+        return state
+
+    def prefetch(self, requirement):
+        # Start the asynchronous parts of the evaluation, if any, so that they overlap with trace checking
+        self.semantic.prefetch(self.trace_suite, requirement)
+
     def get_semantic_desirability_components(self, requirement) -> tuple[float, float]:
         if not hasattr(self.semantic, "get_two_components"):
             raise ValueError("The semantic integrity measure does not support get_two_components.")
@@ -72,8 +95,23 @@ class Desirability:
     def get_raw_desirability_tuple(self, requirement) -> tuple[float, float, float]:
         return self.get_desirability_tuple(requirement, True, True, True)
 
+    def lower_bounds(self, requirement, correctness_values, max_syntactic=None):
+        """
+        Same as evaluate, for each of the given correctness fitness values of the requirement, with a lower bound of
+        the satisfaction extent computed from the correctness (i.e. without checking all the traces).
+        max_syntactic: beyond it, a lower bound of the syntactic similarity is used (see SyntacticSimilarity).
+        """
+        sem_val = self.semantic.evaluate(self.trace_suite, requirement) if self.weights[0] > 0 else 0.0
+        syn_val = self.syntactic.evaluate(requirement, self.initial_requirement, max_fitness=max_syntactic) \
+            if self.weights[1] > 0 else 0.0
+        return [self._weighted((sem_val, syn_val, self.satisfaction.lower_bound(correctness) if self.weights[2] > 0
+                                else 0.0)) for correctness in correctness_values]
+
     def evaluate(self, requirement) -> float:
         des = self.get_desirability_tuple(requirement, self.weights[0] > 0, self.weights[1] > 0, self.weights[2] > 0)
+        return self._weighted(des)
+
+    def _weighted(self, des):
         weighted_des = (
             self.weights[0] * des[0],
             self.weights[1] * des[1],
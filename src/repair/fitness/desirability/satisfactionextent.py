@@ -13,6 +13,9 @@ class TraceSuiteSatisfactionMagnitude(SatisfactionExtent):
 
         sd = current_req.satisfaction_degrees["sd"][0]
         return abs(sd)
+
+    def lower_bound(self, correctness) -> float:
+        return correctness  # sd = -correctness when the requirement is violated
     
 class AvoidAbsoluteSatisfaction(SatisfactionExtent):
     def evaluate(self, current_req, initial_req) -> float:
@@ -21,6 +24,8 @@ class AvoidAbsoluteSatisfaction(SatisfactionExtent):
             0.0 → (pre_sd=0.0 or (pre_sd=1.0 and post_sd=1.0))
             1.0 → otherwise
         '''
+        if current_req.satisfaction_degrees.get("bounded"):
+            return 0.0  # the ratios of a bounded trace checking are partial, 0.0 is a lower bound
 
         pre_sat_ratio_of_items = current_req.satisfaction_degrees["pre_sd"][1]
         post_sat_ratio_of_items = current_req.satisfaction_degrees["post_sd"][1]
@@ -56,6 +61,10 @@ class VerticalAndHorizontalExtent(SatisfactionExtent):
         result_combined = 0.5*result_vertical + 0.5*result_horizontal
         return result_combined
 
+    def lower_bound(self, correctness):
+        result_vertical = self.vertical.lower_bound(correctness)
+        return 0.5*result_vertical/(1.0+result_vertical)  # horizontal extent at least 0.0
+
 
 # class PreconditionSatisfaction(SatisfactionExtent):
 #     def evaluate(self, current_req, initial_req) -> float:
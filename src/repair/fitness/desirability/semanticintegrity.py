@@ -1,13 +1,212 @@
+import atexit
+import functools
 import logging
+import multiprocessing
+import operator
+import os
+import queue
 import random
+import threading
 from collections import deque
+from concurrent.futures import Future
+
+import z3
 from deap import gp
 from repair.fitness.desirability.desirability import SemanticIntegrity
-from repair.fitness.correctness.correctness import eval_tree, is_within_margin
-from z3 import Solver, sat, unsat, unknown
+from repair.fitness.correctness.correctness import is_within_margin
+from repair.fitness.desirability.verdictcache import get_verdict_cache
+from repair.metrics import metrics
+from z3 import sat, unsat, unknown
 
 logger = logging.getLogger("gp_logger")
 
+_z3_local = threading.local()
+
+Z3_FUNCTIONS = {
+    "implies": z3.Implies,
+    "and": z3.And,
+    "or": z3.Or,
+    "not": z3.Not,
+    "eq": operator.eq,
+    "ge": operator.ge,
+    "gt": operator.gt,
+    "le": operator.le,
+    "lt": operator.lt,
+    "add": operator.add,
+    "sub": operator.sub,
+}
+
+
+def z3_tokens(tree):
+    """
+    Returns the tree in a light, picklable prefix form: (name, arity) for primitives, (None, value) for terminals.
+    """
+    return tuple((node.name, node.arity) if isinstance(node, gp.Primitive) else (None, node.value) for node in tree)
+
+
+class Z3Translator:
+    """
+    Translates GP trees (as z3_tokens) straight into Z3 expressions and checks them on a long-lived solver.
+    Each variable of the trace suite has one Real for its current value and one for its previous value (prev).
+    Z3 contexts are not thread-safe: use get_z3_translator() to get the one of the current thread.
+    """
+
+    def __init__(self, variables, timeout=None):
+        self.ctx = z3.Context()
+        self.variables = {var: z3.Real(var, self.ctx) for var in variables}
+        self.prev_variables = {var: z3.Real(f"prev({var})", self.ctx) for var in variables}
+        self.solver = z3.Solver(ctx=self.ctx)
+        if timeout is not None:
+            self.solver.set("timeout", timeout)
+
+    def translate(self, tokens):
+        return self._translate_tokens(iter(tokens))
+
+    def _translate_tokens(self, tokens):
+        name, value = next(tokens)
+        if name is None:  # Terminal
+            if isinstance(value, bool):
+                return z3.BoolVal(value, self.ctx)
+            if isinstance(value, (float, int)):
+                return z3.RealVal(value, self.ctx)
+            if value in self.variables:
+                return self.variables[value]
+            raise ValueError(f"Unrecognized terminal: {value}")
+        if name == "prev":  # prev(_var)
+            _, var = next(tokens)
+            return self.prev_variables[var[1:] if var.startswith("_") else var]
+        fn = Z3_FUNCTIONS.get(name)
+        if fn is None:
+            raise NotImplementedError(f"No Z3 translation defined for {name}")
+        return fn(*[self._translate_tokens(tokens) for _ in range(value)])
+
+    def is_valid(self, tokens):
+        """
+        Checks whether the negation of the formula is satisfiable: unsat means the formula is a tautology.
+        """
+        self.solver.push()
+        try:
+            self.solver.add(z3.Not(self.translate(tokens)))
+            return self.solver.check()
+        finally:
+            self.solver.pop()
+
+
+def get_z3_translator(variables, timeout=None):
+    """
+    Returns the Z3 translator of the current thread (of the current process) for the variables of a trace suite.
+    """
+    if getattr(_z3_local, "pid", None) != os.getpid():
+        _z3_local.pid = os.getpid()
+        _z3_local.translators = {}
+    key = (tuple(variables), timeout)
+    translator = _z3_local.translators.get(key)
+    if translator is None:
+        translator = Z3Translator(variables, timeout)
+        _z3_local.translators[key] = translator
+    return translator
+
+
+def check_validity(variables, tokens, timeout=None) -> str:
+    """
+    Returns the verdict ("sat", "unsat" or "unknown") of the Z3 check of a formula (as z3_tokens).
+    """
+    try:
+        return str(get_z3_translator(variables, timeout).is_valid(tokens))
+    except NotImplementedError as e:
+        logger.info(f"      Z3 check not possible ({e})")
+        return "unknown"
+
+
+def _z3_worker(conn, timeout):
+    while True:
+        job = conn.recv()
+        if job is None:
+            break
+        conn.send(check_validity(*job, timeout))
+
+
+class Z3WorkerPool:
+    """
+    Pool of Z3 worker processes behind a futures API, with hard wall-clock timeouts: a worker that does not answer
+    within the timeout (plus a grace period for the soft Z3 timeout to trigger) is killed and replaced, and the
+    verdict is "unknown".
+    """
+    GRACE_PERIOD = 1.0  # seconds
+
+    def __init__(self, workers, timeout=None):
+        self.timeout = timeout
+        self.timeouts = 0
+        self.jobs = queue.SimpleQueue()
+        # Workers are spawned, since forking a process running threads (and Z3) is not safe
+        self.mp_context = multiprocessing.get_context("spawn")
+        self.threads = [threading.Thread(target=self._dispatch, daemon=True) for _ in range(workers)]
+        for thread in self.threads:
+            thread.start()
+
+    def submit(self, variables, tokens) -> Future:
+        future = Future()
+        self.jobs.put((future, (tuple(variables), tokens)))
+        return future
+
+    def _start_worker(self):
+        conn, child_conn = self.mp_context.Pipe()
+        process = self.mp_context.Process(target=_z3_worker, args=(child_conn, self.timeout), daemon=True)
+        process.start()
+        child_conn.close()
+        return process, conn
+
+    def _dispatch(self):
+        # Each dispatcher thread feeds one worker process, one job at a time
+        process, conn = None, None
+        while (job := self.jobs.get()) is not None:
+            future, payload = job
+            if not future.set_running_or_notify_cancel():
+                continue
+            if process is None:
+                try:
+                    process, conn = self._start_worker()
+                except Exception as e:
+                    future.set_exception(e)
+                    continue
+            try:
+                conn.send(payload)
+                if conn.poll(None if self.timeout is None else self.timeout / 1000 + self.GRACE_PERIOD):
+                    future.set_result(conn.recv())
+                    continue
+                self.timeouts += 1
+                logger.info(f"      Z3 worker timed out, restarting it")
+            except (OSError, EOFError) as e:
+                logger.info(f"      Z3 worker failed ({e}), restarting it")
+            process.kill()
+            process.join()
+            process, conn = None, None
+            future.set_result("unknown")
+        if process is not None:
+            conn.send(None)
+            process.join()
+
+    def close(self):
+        for _ in self.threads:
+            self.jobs.put(None)
+        for thread in self.threads:
+            thread.join()
+
+
+@functools.cache
+def _get_z3_pool(pid, workers, timeout):
+    pool = Z3WorkerPool(workers, timeout)
+    # Stop the dispatcher threads and their workers when the process exits
+    atexit.register(pool.close)
+    return pool
+
+
+def get_z3_pool(workers, timeout=None):
+    """
+    Returns the Z3 worker pool of the current process.
+    """
+    return _get_z3_pool(os.getpid(), workers, timeout)
+
 
 class SamplingBasedTautologyCheck(SemanticIntegrity):
     def __init__(self, n_samples: int = 10):
@@ -20,17 +219,22 @@ class SamplingBasedTautologyCheck(SemanticIntegrity):
             0.0 → candidate has variable correctness across inputs (not tautology/contradiction)
             1.0 → candidate is tautology or contradiction (correctness constant)
         """
+        with metrics.timer("sampling"):
+            return self._evaluate(trace_suite, requirement)
+
+    def _evaluate(self, trace_suite, requirement) -> float:
         base_cor_merged = None
         all_same_merged = True
 
+        # Samples depend on the formula only, so that the verdict does not depend on the evaluation order
+        rng = random.Random(str(requirement.merged))
         for _ in range(self.n_samples):
-            trace = random.choice(trace_suite.traces)
+            trace = rng.choice(trace_suite.traces)
             if len(trace.items) < 2:
                 continue  # skip traces that are too short
-            i = random.randint(1, len(trace.items) - 1)
-            item = trace.items[i]
+            i = rng.randint(1, len(trace.items) - 1)
 
-            cor_merged = eval_tree(requirement.merged, i, item)
+            cor_merged = requirement.compiled_merged.evaluate_item(trace, i)
             if base_cor_merged is None:
                 base_cor_merged = cor_merged
             elif not is_within_margin(cor_merged, base_cor_merged):
@@ -41,52 +245,122 @@ class SamplingBasedTautologyCheck(SemanticIntegrity):
         # it's (likely) trivial, i.e. a constant function (tautology/contradiction)
         # return 1.0 if all_same_pre or all_same_post else 0.0
         if all_same_merged:
-            logger.info(f"      Tautology found (Sampling): {requirement.merged}")
+            logger.info("      Tautology found (Sampling): %s", requirement.merged)
         return 1.0 if all_same_merged else 0.0
 
 
 class Z3TautologyCheck(SemanticIntegrity):
+    VERDICTS = {"sat": sat, "unsat": unsat, "unknown": unknown}
+
+    def __init__(self, verdict_cache=None, timeout=None, workers=0):
+        """
+        timeout: per-check Z3 timeout in milliseconds (None for no timeout); checks that time out are unknown.
+        workers: number of Z3 worker processes checking formulas asynchronously (0 to check them in-process).
+        """
+        super().__init__()
+        self.verdict_cache = verdict_cache if verdict_cache is not None else get_verdict_cache()
+        self.timeout = timeout
+        self.workers = workers
+        self.pending = {}  # futures of the formulas submitted to the worker pool
+        self.prefetched = set()  # formulas submitted by prefetch, whose verdict was not read yet
+        self.lock = threading.RLock()
+
+    def __getstate__(self):
+        state = self.__dict__.copy()
+        state.update(pending={}, prefetched=set())
+        del state["lock"]
+        return state
+
+    def __setstate__(self, state):
+        self.__dict__.update(state)
+        self.lock = threading.RLock()
+
+    def _submit(self, trace_suite, key, requirement) -> Future:
+        with self.lock:
+            future = self.pending.get(key)
+            if future is None:
+                # The check may have completed since the caller looked the verdict up (_done caches the verdict
+                # before the future leaves pending)
+                verdict = self.verdict_cache.get(key, record=False)
+                if verdict is not None:
+                    future = Future()
+                    future.set_result(verdict)
+                    return future
+                future = get_z3_pool(self.workers, self.timeout).submit(trace_suite.variables,
+                                                                        z3_tokens(requirement.merged))
+                self.pending[key] = future
+                future.add_done_callback(lambda f: self._done(key, f))
+            return future
+
     @staticmethod
-    def evaluate_sat(requirement) -> float:
-        consts = {node.value for node in requirement.merged # use set to filter duplicates
-                  if isinstance(node, gp.Terminal) and isinstance(node.value, str)}
-        smtlib_decl = " ".join([f"(declare-const {const} Real)" for const in consts])
-        smtlib_req = (requirement.merged.__str__()
-                      .replace(",", "")
-                      .replace("prev('", "")
-                      .replace("')", "")
-                      .replace("implies(", "(=> ")
-                      .replace("eq(", "(= ")
-                      .replace("ge(", "(>= ")
-                      .replace("gt(", "(> ")
-                      .replace("le(", "(<= ")
-                      .replace("lt(", "(< ")
-                      .replace("sub(", "(- ")
-                      .replace("add(", "(+ ")
-                      .replace("and(", "(and ")
-                      .replace("or(", "(or ")
-                      .replace("not(", "(not "))
-        smtlib = f"{smtlib_decl} (assert (not {smtlib_req}))"
-        solver = Solver()
-        solver.from_string(smtlib)
-        result = solver.check()
-        if result != sat:
-            logger.info(f"      Tautology found (Z3): {smtlib_req}")
+    def _verdict(future):
+        # A check whose worker failed (e.g. could not start) is unknown, as a check that timed out
+        try:
+            return future.result()
+        except Exception as e:
+            logger.info(f"      Z3 check failed ({e!r})")
+            return "unknown"
 
-        return result
+    def _done(self, key, future):
+        try:
+            self.verdict_cache.put(key, self._verdict(future))
+        finally:
+            with self.lock:
+                self.pending.pop(key, None)
+
+    def prefetch(self, trace_suite, requirement):
+        if self.workers > 0:
+            key = self.verdict_cache.key(requirement.merged)
+            if self.verdict_cache.get(key, record=False) is None:
+                with self.lock:
+                    self.prefetched.add(key)
+                self._submit(trace_suite, key, requirement)
+
+    def evaluate_sat(self, trace_suite, requirement) -> float:
+        key = self.verdict_cache.key(requirement.merged)
+        with self.lock:
+            prefetched = key in self.prefetched
+            self.prefetched.discard(key)
+        # A verdict computed since its prefetch is not a cache hit
+        verdict = self.verdict_cache.get(key, record=not prefetched)
+        if verdict is not None and prefetched:
+            metrics.count(f"z3_{verdict}")
+            if verdict != "sat":
+                logger.info("      Tautology found (Z3): %s", requirement.merged)
+            return self.VERDICTS[verdict]
+        if verdict is not None:
+            metrics.count("z3_cached")
+            if verdict != "sat":
+                logger.info("      Tautology found (Z3, cached): %s", requirement.merged)
+            return self.VERDICTS[verdict]
+
+        # With workers, the time waited for the verdict (the check started at prefetch)
+        with metrics.timer("z3"):
+            if self.workers > 0:
+                verdict = self._verdict(self._submit(trace_suite, key, requirement))
+            else:
+                verdict = check_validity(trace_suite.variables, z3_tokens(requirement.merged), self.timeout)
+                self.verdict_cache.put(key, verdict)
+        metrics.count(f"z3_{verdict}")
+        if verdict != "sat":
+            logger.info("      Tautology found (Z3): %s", requirement.merged)
+        return self.VERDICTS[verdict]
 
     def evaluate(self, trace_suite, requirement) -> float:
-        return 1.0 if self.evaluate_sat(requirement) != sat else 0.0
+        return 1.0 if self.evaluate_sat(trace_suite, requirement) != sat else 0.0
 
 
 class Z3TautologyCheckWithSamplingFallback(SemanticIntegrity):
-    def __init__(self, n_samples: int = 10):
+    def __init__(self, n_samples: int = 10, verdict_cache=None, timeout=None, workers=0):
         super().__init__()
-        self.z3 = Z3TautologyCheck()
+        self.z3 = Z3TautologyCheck(verdict_cache, timeout, workers)
         self.sampling = SamplingBasedTautologyCheck(n_samples)
 
+    def prefetch(self, trace_suite, requirement):
+        self.z3.prefetch(trace_suite, requirement)
+
     def evaluate(self, trace_suite, requirement) -> float:
-        result = self.z3.evaluate_sat(requirement)
+        result = self.z3.evaluate_sat(trace_suite, requirement)
         if result == unknown:
             return self.sampling.evaluate(trace_suite, requirement)
         elif result == unsat:
@@ -100,6 +374,9 @@ class VarTypeConsistencyCheck(SemanticIntegrity):
         node = remaining_nodes.popleft()
         if isinstance(node, gp.Terminal):
             value = node.value
+            # Boolean constant (e.g. a True precondition), no variables involved
+            if isinstance(value, bool):
+                return 0.0
             # Number
             if isinstance(value, (float, int)):
                 if node.name.startswith("rand_float_"):
@@ -155,10 +432,11 @@ class VarTypeConsistencyCheck(SemanticIntegrity):
             raise TypeError(f"Unexpected node type: {node}")
 
     def evaluate(self, trace_suite, requirement):
-        result = max(self.evaluate_nodes(trace_suite, deque(iter(requirement.pre))),
-                     self.evaluate_nodes(trace_suite, deque(iter(requirement.post))))
+        with metrics.timer("var_type"):
+            result = max(self.evaluate_nodes(trace_suite, deque(iter(requirement.pre))),
+                         self.evaluate_nodes(trace_suite, deque(iter(requirement.post))))
         if result == 1.0:
-            logger.info(f"      Var type inconsistency found: {requirement.merged}")
+            logger.info("      Var type inconsistency found: %s", requirement.merged)
         return result
 
 
@@ -169,6 +447,9 @@ class TautologyAndVarTypeSanity(SemanticIntegrity):
         self.var_type = VarTypeConsistencyCheck()
         self.composed=True
 
+    def prefetch(self, trace_suite, requirement):
+        self.tautology.prefetch(trace_suite, requirement)
+
     def get_two_components(self, trace_suite, requirement):
         result_tautology = self.tautology.evaluate(trace_suite, requirement) # {0.0, 1.0}
         result_var_type = self.var_type.evaluate(trace_suite, requirement) # {0.0, 1.0} (may become continuous)
@@ -1,43 +1,170 @@
-
 from repair.fitness.desirability.desirability import SyntacticSimilarity
+from repair.metrics import metrics
 import math
 from collections import Counter
-from zss import simple_distance, Node, distance
+
+
+def preprocess_tree(tree):
+    """
+    Preprocesses a GP tree (prefix array) for the Zhang-Shasha tree edit distance: returns the node labels in
+    postorder, the postorder index of the leftmost leaf of each node, and the keyroots.
+    """
+    labels = []
+    leftmost = []
+
+    def visit(i):
+        node = tree[i]
+        i += 1
+        first_leaf = None
+        for _ in range(node.arity):
+            i, leaf = visit(i)
+            if first_leaf is None:
+                first_leaf = leaf
+        labels.append(node.name)  # name is important here
+        leftmost.append(len(labels) - 1 if first_leaf is None else first_leaf)
+        return i, leftmost[-1]
+
+    visit(0)
+    # keyroots: the highest node sharing each leftmost leaf (i.e. the root and all nodes with a left sibling)
+    keyroots = sorted({leaf: k for k, leaf in enumerate(leftmost)}.values())
+    return labels, leftmost, keyroots
+
+
+def tree_edit_distance(tree1, tree2, upper_bound=None):
+    """
+    Zhang-Shasha tree edit distance between two preprocessed trees, with unit insert, remove and update costs.
+    If upper_bound is given and the distance is provably larger, a lower bound larger than upper_bound is returned
+    without computing the exact distance.
+    """
+    labels1, leftmost1, keyroots1 = tree1
+    labels2, leftmost2, keyroots2 = tree2
+    if upper_bound is not None:
+        # Every node is either removed, inserted, or mapped; mapped nodes with different labels are updated
+        common_labels = sum((Counter(labels1) & Counter(labels2)).values())
+        lower_bound = max(len(labels1), len(labels2)) - common_labels
+        if lower_bound > upper_bound:
+            return lower_bound
+
+    tree_dist = [[0] * len(labels2) for _ in labels1]
+    for i in keyroots1:
+        for j in keyroots2:
+            left_i, left_j = leftmost1[i], leftmost2[j]
+            m, n = i - left_i + 2, j - left_j + 2
+            # forest distances between the postorder prefixes [left_i, x) and [left_j, y)
+            forest_dist = [[0] * n for _ in range(m)]
+            for x in range(1, m):
+                forest_dist[x][0] = x
+            for y in range(1, n):
+                forest_dist[0][y] = y
+            for x in range(1, m):
+                node_x = left_i + x - 1
+                for y in range(1, n):
+                    node_y = left_j + y - 1
+                    if leftmost1[node_x] == left_i and leftmost2[node_y] == left_j:  # both forests are trees
+                        cost = 0 if labels1[node_x] == labels2[node_y] else 1
+                        forest_dist[x][y] = min(forest_dist[x - 1][y] + 1,
+                                                forest_dist[x][y - 1] + 1,
+                                                forest_dist[x - 1][y - 1] + cost)
+                        tree_dist[node_x][node_y] = forest_dist[x][y]
+                    else:
+                        forest_dist[x][y] = min(forest_dist[x - 1][y] + 1,
+                                                forest_dist[x][y - 1] + 1,
+                                                forest_dist[leftmost1[node_x] - left_i][leftmost2[node_y] - left_j] +
+                                                tree_dist[node_x][node_y])
+    return tree_dist[-1][-1]
+
+
+def tree_edit_operations(tree1, tree2):
+    """
+    Number of edit operations other than matches in the Zhang-Shasha edit script between two preprocessed trees, with
+    unit insert, remove and update costs, as listed by zss.simple_distance(..., return_operations=True): the scripts
+    of the forests made of removals (resp. insertions) only keep their last operation, so the count can be smaller
+    than the tree edit distance.
+    """
+    labels1, leftmost1, keyroots1 = tree1
+    labels2, leftmost2, keyroots2 = tree2
+    tree_dist = [[0] * len(labels2) for _ in labels1]
+    tree_ops = [[0] * len(labels2) for _ in labels1]
+    for i in keyroots1:
+        for j in keyroots2:
+            left_i, left_j = leftmost1[i], leftmost2[j]
+            m, n = i - left_i + 2, j - left_j + 2
+            # forest distances and operation counts between the postorder prefixes [left_i, x) and [left_j, y)
+            forest_dist = [[0] * n for _ in range(m)]
+            forest_ops = [[0] * n for _ in range(m)]
+            for x in range(1, m):
+                forest_dist[x][0] = x
+                forest_ops[x][0] = 1
+            for y in range(1, n):
+                forest_dist[0][y] = y
+                forest_ops[0][y] = 1
+            for x in range(1, m):
+                node_x = left_i + x - 1
+                for y in range(1, n):
+                    node_y = left_j + y - 1
+                    remove = forest_dist[x - 1][y] + 1
+                    insert = forest_dist[x][y - 1] + 1
+                    if leftmost1[node_x] == left_i and leftmost2[node_y] == left_j:  # both forests are trees
+                        cost = 0 if labels1[node_x] == labels2[node_y] else 1
+                        diagonal = forest_dist[x - 1][y - 1] + cost
+                        diagonal_ops = forest_ops[x - 1][y - 1] + cost
+                    else:
+                        x_prev, y_prev = leftmost1[node_x] - left_i, leftmost2[node_y] - left_j
+                        diagonal = forest_dist[x_prev][y_prev] + tree_dist[node_x][node_y]
+                        diagonal_ops = forest_ops[x_prev][y_prev] + tree_ops[node_x][node_y]
+                    # ties are broken in the zss order: remove, insert, then update/match
+                    if remove <= insert and remove <= diagonal:
+                        forest_dist[x][y], forest_ops[x][y] = remove, forest_ops[x - 1][y] + 1
+                    elif insert <= diagonal:
+                        forest_dist[x][y], forest_ops[x][y] = insert, forest_ops[x][y - 1] + 1
+                    else:
+                        forest_dist[x][y], forest_ops[x][y] = diagonal, diagonal_ops
+                    if leftmost1[node_x] == left_i and leftmost2[node_y] == left_j:
+                        tree_dist[node_x][node_y] = forest_dist[x][y]
+                        tree_ops[node_x][node_y] = forest_ops[x][y]
+    return tree_ops[-1][-1]
 
 
 class TreeEditDistance(SyntacticSimilarity):
     
-    def __init__(self):
+    def __init__(self, exact=False):
+        """
+        exact: whether the fitness is the exact tree edit distance (see tree_edit_distance) rather than the number of
+        operations of the zss edit script (see tree_edit_operations), which can be smaller.
+        """
         super().__init__()
-
-    def tree_to_zss_node(self, tree):
-        # tree is iterable, root is tree[0]
-        def build_subtree(expr, idx=0):
-            node = Node(expr[idx].name) # name is important here
-            arity = expr[idx].arity if hasattr(expr[idx], "arity") else 0
-            next_idx = idx + 1
-            for _ in range(arity):
-                child, next_idx = build_subtree(expr, next_idx)
-                node.addkid(child)
-            return node, next_idx
-        root, _ = build_subtree(tree)
-        return root
-    
-    def tree_size(self, node):
-        return 1 + sum(self.tree_size(child) for child in node.children)
-
-    def _get_tree_edit_distance(self, individual, original):
-        node1 = self.tree_to_zss_node(individual)
-        node2 = self.tree_to_zss_node(original)
-        return node1, node2, simple_distance(node1, node2, return_operations=True)
-        
-    def evaluate(self, current_req, initial_req):
-        node1, node2, (zss_ted, operations) = self._get_tree_edit_distance(current_req.merged, initial_req.merged)
-        tree_edit_distance = sum(1 for op in operations if op.type != 3)
-
-        max_edit_dist = max(self.tree_size(node1), self.tree_size(node2))
-        fitness = float(tree_edit_distance / max_edit_dist) if max_edit_dist > 0 else 0.0
-        return fitness
+        self.exact = exact
+        # The initial requirement never changes during a run: preprocess it once
+        self._original = (None, None)
+
+    def _preprocess_original(self, original):
+        cached, preprocessed = self._original
+        if cached is not original:
+            preprocessed = preprocess_tree(original)
+            self._original = (original, preprocessed)
+        return preprocessed
+
+    def evaluate(self, current_req, initial_req, max_fitness=None):
+        """
+        The fitness is the number of edit operations (or the exact tree edit distance) over the size of the largest
+        tree.
+        max_fitness: with the exact distance, if the fitness is provably larger, a lower bound of it (still larger than
+        max_fitness) is returned instead, e.g. for candidates already dominated on syntactic similarity. The label
+        lower bound does not hold for the operation count, which is always computed.
+        """
+        with metrics.timer("tree_edit_distance"):
+            original = self._preprocess_original(initial_req.merged)
+            current = preprocess_tree(current_req.merged)
+            max_edit_dist = max(len(current[0]), len(original[0]))
+            if max_edit_dist == 0:
+                return 0.0
+            if not self.exact:
+                return float(tree_edit_operations(current, original) / max_edit_dist)
+            upper_bound = None if max_fitness is None else math.floor(max_fitness * max_edit_dist)
+            distance = tree_edit_distance(current, original, upper_bound)
+            if upper_bound is not None and distance > upper_bound:
+                metrics.count("tree_edit_distance_bounded")
+            return float(distance / max_edit_dist)
 
 
 class CosineSimilarity(SyntacticSimilarity):
@@ -86,7 +213,7 @@ class CosineSimilarity(SyntacticSimilarity):
         similarity = dot / (mag1 * mag2)
         return similarity
 
-    def evaluate(self, current_req, initial_req):
+    def evaluate(self, current_req, initial_req, max_fitness=None):
         cosine_similarity = self._get_cosine_similarity(current_req.merged, initial_req.merged)
         fitness = 1 - cosine_similarity
         return fitness
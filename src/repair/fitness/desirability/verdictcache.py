@@ -0,0 +1,119 @@
+import functools
+import logging
+import os
+import sqlite3
+import threading
+
+from deap import gp
+
+import repair.grammar.utils as grammar_utils
+
+logger = logging.getLogger("gp_logger")
+
+
+class VerdictCache:
+    """
+    Cache of tautology check verdicts ("sat", "unsat", "unknown"), keyed by normalized formula, i.e. with the arguments
+    of commutative functions in canonical order, variables alpha-renamed in order of appearance and constants
+    optionally rounded to a number of decimal digits.
+    Verdicts are held in memory and, if a path is given, persisted in a SQLite store that can be shared by concurrent
+    processes (e.g. the runs of bin/evaluation.py). Unknown verdicts are not persisted, since they can depend on the
+    solver resources.
+    """
+
+    def __init__(self, path=None, precision=None):
+        self.path = path
+        self.precision = precision
+        self.verdicts = {}
+        self.hits = 0
+        self.misses = 0
+        self.lock = threading.Lock()
+        self.local = threading.local()
+
+    def key(self, tree):
+        names = {}
+        tokens = []
+        for node in grammar_utils.canonical(tree):
+            if isinstance(node, gp.Primitive):
+                tokens.append(node.name)
+            elif isinstance(node.value, str):  # Variable (prev variables keep their underscore prefix)
+                tokens.append(names.setdefault(node.value, f"v{len(names)}"))
+            elif self.precision is not None and not isinstance(node.value, bool):
+                tokens.append(repr(round(float(node.value), self.precision)))
+            else:
+                tokens.append(repr(node.value))
+        return " ".join(tokens)
+
+    def _connection(self):
+        # SQLite connections cannot be shared across threads or processes
+        if getattr(self.local, "pid", None) != os.getpid():
+            os.makedirs(os.path.dirname(self.path) or ".", exist_ok=True)
+            connection = sqlite3.connect(self.path, timeout=60)
+            connection.execute("PRAGMA journal_mode=WAL")
+            connection.execute("CREATE TABLE IF NOT EXISTS verdicts (formula TEXT PRIMARY KEY, verdict TEXT)")
+            connection.commit()
+            self.local.pid = os.getpid()
+            self.local.connection = connection
+        return self.local.connection
+
+    def get(self, key, record=True):
+        """
+        Returns the verdict of the formula, or None; record: whether to count the lookup in the hit rate.
+        """
+        with self.lock:
+            verdict = self.verdicts.get(key)
+        if verdict is None and self.path is not None:
+            try:
+                row = self._connection().execute("SELECT verdict FROM verdicts WHERE formula = ?", (key,)).fetchone()
+            except sqlite3.Error as e:
+                logger.info(f"Could not read the verdict cache ({e})")
+                row = None
+            if row is not None:
+                verdict = row[0]
+                with self.lock:
+                    self.verdicts[key] = verdict
+        if record:
+            with self.lock:
+                if verdict is None:
+                    self.misses += 1
+                else:
+                    self.hits += 1
+        return verdict
+
+    def put(self, key, verdict):
+        with self.lock:
+            self.verdicts[key] = verdict
+        if self.path is not None and verdict != "unknown":
+            try:
+                connection = self._connection()
+                connection.execute("INSERT OR IGNORE INTO verdicts VALUES (?, ?)", (key, verdict))
+                connection.commit()
+            except sqlite3.Error as e:
+                logger.info(f"Could not write the verdict cache ({e})")
+
+    @property
+    def hit_rate(self):
+        lookups = self.hits + self.misses
+        return self.hits / lookups if lookups else 0.0
+
+    def __len__(self):
+        return len(self.verdicts)
+
+    def __getstate__(self):
+        # Locks and connections stay in the owning process
+        state = self.__dict__.copy()
+        del state["lock"], state["local"]
+        return state
+
+    def __setstate__(self, state):
+        self.__dict__.update(state)
+        self.lock = threading.Lock()
+        self.local = threading.local()
+
+
+@functools.cache
+def get_verdict_cache(path=None, precision=None):
+    """
+    Returns the verdict cache for the given store and precision, shared by all the runs of the current process.
+    """
+    return VerdictCache(path, precision)
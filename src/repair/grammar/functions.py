@@ -1,5 +1,6 @@
 from typing import Callable, List, Type
 import operator
+import numpy as np
 delta = 1e-5
 
 def logical_and(a, b): return a and b
@@ -19,6 +20,28 @@ def or_robustness(a, b): return max(a, b)
 def impl_robustness(a, b): return max(-a, b)
 def not_robustness(a): return -a
 
+# vectorized variants, for robustness functions that do not work on arrays as-is
+def eq_robustness_vectorized(a, b): return np.where(a == b, delta, -np.abs(a - b))
+def and_robustness_vectorized(a, b): return np.minimum(a, b)
+def or_robustness_vectorized(a, b): return np.maximum(a, b)
+def impl_robustness_vectorized(a, b): return np.maximum(-a, b)
+
+# interval variants, bounding the robustness over blocks of trace items: each argument is a (lower, upper) pair of
+# arrays, the operations are in the same order as the exact functions so that rounding never breaks the bounds
+def add_robustness_interval(a, b): return a[0] + b[0], a[1] + b[1]
+def sub_robustness_interval(a, b): return a[0] - b[1], a[1] - b[0]
+def lt_robustness_interval(a, b): return b[0] - a[1] - delta, b[1] - a[0] - delta
+def le_robustness_interval(a, b): return b[0] - a[1] + delta, b[1] - a[0] + delta
+def gt_robustness_interval(a, b): return a[0] - b[1] - delta, a[1] - b[0] - delta
+def ge_robustness_interval(a, b): return a[0] - b[1] + delta, a[1] - b[0] + delta
+def eq_robustness_interval(a, b):
+    overlap = (a[0] <= b[1]) & (b[0] <= a[1])
+    return -np.maximum(a[1] - b[0], b[1] - a[0]), np.where(overlap, delta, -np.maximum(b[0] - a[1], a[0] - b[1]))
+def and_robustness_interval(a, b): return np.minimum(a[0], b[0]), np.minimum(a[1], b[1])
+def or_robustness_interval(a, b): return np.maximum(a[0], b[0]), np.maximum(a[1], b[1])
+def impl_robustness_interval(a, b): return np.maximum(-a[1], b[0]), np.maximum(-a[0], b[1])
+def not_robustness_interval(a): return -a[1], -a[0]
+
 # this differentiates bool and int types, since bool is a subclass of int in Python
 class Bool: pass
 
@@ -28,31 +51,51 @@ class GrammarFunction:
                  input_types: List[Type],
                  return_type: Type,
                  robustness_fn: Callable,
-                 display_name: str = None):
+                 display_name: str = None,
+                 vectorized_fn: Callable = None,
+                 interval_fn: Callable = None,
+                 commutative: bool = False):
         self.name = name  # Python identifier
         self.impl = impl  # Function used in the GP tree
         self.input_types = input_types
         self.return_type = return_type
         self.robustness_fn = robustness_fn  # Used for violation scoring
         self.display_name = display_name or name
+        self.vectorized_fn = vectorized_fn or robustness_fn  # Used for whole-trace (array) scoring
+        self.interval_fn = interval_fn  # Used to bound the scores over blocks of trace items (None: unbounded)
+        self.commutative = commutative  # Same robustness whatever the order of the arguments
 
     @staticmethod
     def create_functions():
         return [
             # Arithmetic ops
-            GrammarFunction("add", operator.add, [float, float], float, robustness_fn=add_robustness, display_name="+"),
-            GrammarFunction("sub", operator.sub, [float, float], float, robustness_fn=sub_robustness, display_name="-"),
+            GrammarFunction("add", operator.add, [float, float], float, robustness_fn=add_robustness, display_name="+",
+                            interval_fn=add_robustness_interval, commutative=True),
+            GrammarFunction("sub", operator.sub, [float, float], float, robustness_fn=sub_robustness, display_name="-",
+                            interval_fn=sub_robustness_interval),
             # Comparison ops
-            GrammarFunction("lt", operator.lt, [float, float], Bool, robustness_fn=lt_robustness, display_name="<"),
-            GrammarFunction("le", operator.le, [float, float], Bool, robustness_fn=le_robustness, display_name="<="),
-            GrammarFunction("gt", operator.gt, [float, float], Bool, robustness_fn=gt_robustness, display_name=">"),
-            GrammarFunction("ge", operator.ge, [float, float], Bool, robustness_fn=ge_robustness, display_name=">="),
-            GrammarFunction("eq", operator.eq, [float, float], Bool, robustness_fn=eq_robustness, display_name="=="),
+            GrammarFunction("lt", operator.lt, [float, float], Bool, robustness_fn=lt_robustness, display_name="<",
+                            interval_fn=lt_robustness_interval),
+            GrammarFunction("le", operator.le, [float, float], Bool, robustness_fn=le_robustness, display_name="<=",
+                            interval_fn=le_robustness_interval),
+            GrammarFunction("gt", operator.gt, [float, float], Bool, robustness_fn=gt_robustness, display_name=">",
+                            interval_fn=gt_robustness_interval),
+            GrammarFunction("ge", operator.ge, [float, float], Bool, robustness_fn=ge_robustness, display_name=">=",
+                            interval_fn=ge_robustness_interval),
+            GrammarFunction("eq", operator.eq, [float, float], Bool, robustness_fn=eq_robustness, display_name="==",
+                            vectorized_fn=eq_robustness_vectorized, interval_fn=eq_robustness_interval,
+                            commutative=True),
             # Logic ops
-            GrammarFunction("and", logical_and, [Bool, Bool], Bool, robustness_fn=and_robustness, display_name="and"),
-            GrammarFunction("or", logical_or, [Bool, Bool], Bool, robustness_fn=or_robustness, display_name="or"),
-            GrammarFunction("implies", logical_impl, [Bool, Bool], Bool, robustness_fn=impl_robustness, display_name="=>"),
-            GrammarFunction("not", operator.not_, [Bool], Bool, robustness_fn=not_robustness, display_name="not"),
+            GrammarFunction("and", logical_and, [Bool, Bool], Bool, robustness_fn=and_robustness, display_name="and",
+                            vectorized_fn=and_robustness_vectorized, interval_fn=and_robustness_interval,
+                            commutative=True),
+            GrammarFunction("or", logical_or, [Bool, Bool], Bool, robustness_fn=or_robustness, display_name="or",
+                            vectorized_fn=or_robustness_vectorized, interval_fn=or_robustness_interval,
+                            commutative=True),
+            GrammarFunction("implies", logical_impl, [Bool, Bool], Bool, robustness_fn=impl_robustness, display_name="=>",
+                            vectorized_fn=impl_robustness_vectorized, interval_fn=impl_robustness_interval),
+            GrammarFunction("not", operator.not_, [Bool], Bool, robustness_fn=not_robustness, display_name="not",
+                            interval_fn=not_robustness_interval),
             GrammarFunction("prev", lambda: None, [str], float, robustness_fn=lambda: None, display_name="prev"),
             # GrammarFunction("dur", lambda: None, [int, Bool], Bool, robustness_fn=lambda: None, display_name="dur")
         ]
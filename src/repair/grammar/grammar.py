@@ -7,12 +7,15 @@ GRAMMAR_FUNCTIONS = []
 GRAMMAR_STATIC_TERMINALS = []
 GRAMMAR_EPHEMERAL_TERMINALS = []
 ROBUSTNESS_FN_MAP = {}
+VECTORIZED_ROBUSTNESS_FN_MAP = {}
+INTERVAL_ROBUSTNESS_FN_MAP = {}
 DISPLAY_MAP = {}
 TERMINAL_NAMES = set()
+COMMUTATIVE_FUNCTIONS = set()
 
 def get_gp_primitive_sets(trace_suite, numbers_factor):
     global GRAMMAR_FUNCTIONS, GRAMMAR_STATIC_TERMINALS, GRAMMAR_EPHEMERAL_TERMINALS, ROBUSTNESS_FN_MAP, DISPLAY_MAP,\
-           TERMINAL_NAMES
+           TERMINAL_NAMES, VECTORIZED_ROBUSTNESS_FN_MAP, INTERVAL_ROBUSTNESS_FN_MAP
 
     GRAMMAR_FUNCTIONS = GrammarFunction.create_functions()
     GRAMMAR_STATIC_TERMINALS = GrammarTerminal.create_terminals(trace_suite)
@@ -34,7 +37,11 @@ def get_gp_primitive_sets(trace_suite, numbers_factor):
     ## OPERATORS
     for func in GRAMMAR_FUNCTIONS:
         ROBUSTNESS_FN_MAP[func.name] = func.robustness_fn
+        VECTORIZED_ROBUSTNESS_FN_MAP[func.name] = func.vectorized_fn
+        INTERVAL_ROBUSTNESS_FN_MAP[func.name] = func.interval_fn
         DISPLAY_MAP[func.name] = func.display_name
+        if func.commutative:
+            COMMUTATIVE_FUNCTIONS.add(func.name)
         pset_pre.addPrimitive(func.impl, func.input_types, func.return_type, name=func.name)
         pset_post.addPrimitive(func.impl, func.input_types, func.return_type, name=func.name)
 
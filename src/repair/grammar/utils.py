@@ -1,4 +1,4 @@
-from repair.grammar.grammar import DISPLAY_MAP
+from repair.grammar.grammar import DISPLAY_MAP, COMMUTATIVE_FUNCTIONS
 from deap import gp
 
 def to_infix(individual):
@@ -21,3 +21,41 @@ def to_infix(individual):
     it = iter(individual)
     return recurse(next(it), it)
 
+
+def canonical(tree):
+    """
+    Returns the nodes of the tree with the arguments of commutative functions sorted by their string form, so that
+    trees only differing by the order of such arguments (e.g. a and b, b and a) have the same nodes.
+    """
+    def recurse(begin):
+        node = tree[begin]
+        end = begin + 1
+        args = []
+        for _ in range(node.arity):
+            arg, end = recurse(end)
+            args.append(arg)
+        if node.name in COMMUTATIVE_FUNCTIONS:
+            args.sort(key=lambda arg: arg[0])
+        return (node.format(*[string for string, _ in args]), [node] + [n for _, nodes in args for n in nodes]), end
+
+    (_, nodes), _ = recurse(0)
+    return nodes
+
+
+def is_constant(node):
+    return isinstance(node, gp.Terminal) and isinstance(node.value, (float, int)) and not isinstance(node.value, bool)
+
+
+def constant(node, value):
+    """
+    Returns a constant node of the same kind as node (ephemeral, i.e. typed by its unit, or parsed) with another value.
+    node can also be an ephemeral class.
+    """
+    if isinstance(node, type):
+        constant = node.__new__(node)
+    elif type(node) is gp.Terminal:
+        return gp.Terminal(value, False, node.ret)
+    else:
+        constant = type(node).__new__(type(node))
+    constant.value = value
+    return constant
@@ -0,0 +1,100 @@
+import json
+import os
+import threading
+import time
+from collections import defaultdict
+
+
+class Timer:
+    """
+    Context manager adding the time of its block to a timer of the metrics; the time is then available in elapsed.
+    """
+    __slots__ = ("metrics", "name", "start", "elapsed")
+
+    def __init__(self, metrics, name):
+        self.metrics = metrics
+        self.name = name
+        self.elapsed = 0.0
+
+    def __enter__(self):
+        self.start = time.perf_counter()
+        return self
+
+    def __exit__(self, *exc_info):
+        self.elapsed = time.perf_counter() - self.start
+        self.metrics.add_time(self.name, self.elapsed)
+        return False
+
+
+class Metrics:
+    """
+    Timers (total time and number of calls) and counters of the current process, accumulated until taken.
+    Thread-safe, so that the fitness components can be timed from the threads of the evaluation backend.
+    """
+
+    def __init__(self):
+        self.lock = threading.Lock()
+        self.timers = defaultdict(lambda: [0, 0.0])
+        self.counters = defaultdict(int)
+
+    def timer(self, name):
+        return Timer(self, name)
+
+    def add_time(self, name, elapsed, calls=1):
+        with self.lock:
+            timer = self.timers[name]
+            timer[0] += calls
+            timer[1] += elapsed
+
+    def count(self, name, n=1):
+        with self.lock:
+            self.counters[name] += n
+
+    def take(self):
+        """
+        Returns the timers and counters accumulated so far, and starts again from zero.
+        """
+        with self.lock:
+            taken = {"timers": {name: {"calls": calls, "time": elapsed}
+                                for name, (calls, elapsed) in self.timers.items()},
+                     "counters": dict(self.counters)}
+            self.timers.clear()
+            self.counters.clear()
+        return taken
+
+    def merge(self, taken):
+        """
+        Adds the timers and counters taken elsewhere, e.g. in a worker process.
+        """
+        for name, timer in taken["timers"].items():
+            self.add_time(name, timer["time"], timer["calls"])
+        for name, n in taken["counters"].items():
+            self.count(name, n)
+
+
+# The metrics of the current process
+metrics = Metrics()
+
+
+class MetricsWriter:
+    """
+    Appends metric records to a JSON lines file, one record per line.
+    """
+
+    def __init__(self, path):
+        self.path = path
+
+    def for_island(self, index):
+        root, ext = os.path.splitext(self.path)
+        return MetricsWriter(f"{root}_island{index}{ext}")
+
+    def reset(self):
+        try:
+            os.remove(self.path)
+        except FileNotFoundError:
+            pass
+
+    def write(self, record):
+        os.makedirs(os.path.dirname(self.path) or ".", exist_ok=True)
+        with open(self.path, "a", encoding="utf-8") as metrics_file:
+            metrics_file.write(json.dumps(record, default=float) + "\n")
@@ -0,0 +1,121 @@
+import copy
+import os
+import random
+import unittest
+from collections import deque
+
+import numpy as np
+from deap import gp
+
+from repair.approach.optimization import simplification
+from repair.approach.optimization.expressiongenerator import generate_expr
+from repair.approach.optimization.fitnessarchive import FitnessArchive
+from repair.approach.trace import get_trace_suite
+from repair.fitness.correctness.compiler import compile_tree
+from repair.fitness.desirability.semanticintegrity import VarTypeConsistencyCheck
+from repair.grammar import grammar
+
+DATA_DIR = os.path.join(os.path.dirname(os.path.abspath(__file__)), os.pardir, "data")
+
+
+class SimplificationTest(unittest.TestCase):
+
+    @classmethod
+    def setUpClass(cls):
+        cls.suite = get_trace_suite(os.path.join(DATA_DIR, "traces"), {"xin", "reset", "TL", "BL", "ic", "dT"}, 0.0)
+        cls.pset_pre, cls.pset_post = grammar.get_gp_primitive_sets(cls.suite, 1.2)
+
+    def random_trees(self, pset, n, seed=0):
+        """
+        Random trees, some wrapped into redundant forms (e.g. not(not(x)), x and x, x - x).
+        """
+        random.seed(seed)
+        expr_mut = lambda pset, type_: generate_expr(pset, 1, 2, type_=type_, condition_str="full")
+        trees = []
+        for _ in range(n):
+            tree = gp.PrimitiveTree(generate_expr(pset, 2, 3))
+            for _ in range(random.randint(0, 3)):
+                tree, = gp.mutUniform(tree, expr_mut, pset)
+            redundancy = random.randrange(5)
+            if redundancy == 0:
+                tree = gp.PrimitiveTree([pset.mapping["not"], pset.mapping["not"]] + list(tree))
+            elif redundancy == 1:
+                tree = gp.PrimitiveTree([pset.mapping["and"]] + list(tree) + list(tree))
+            elif redundancy == 2:
+                tree = gp.PrimitiveTree([pset.mapping["not"]] + list(tree))
+            elif redundancy == 3:
+                # x - x compared to a random float subtree of the tree
+                floats = [i for i, node in enumerate(tree) if node.ret is float and node.name != "prev"]
+                if floats:
+                    expr = tree[tree.searchSubtree(random.choice(floats))]
+                    tree = gp.PrimitiveTree([pset.mapping["and"]] + list(tree) + [pset.mapping["lt"]] +
+                                            [pset.mapping["sub"]] + expr + expr + expr)
+            trees.append(tree)
+        return trees
+
+    def robustness(self, tree):
+        compiled = compile_tree(tree, self.suite)
+        return [compiled.evaluate(trace) for trace in self.suite.traces]
+
+    def var_type(self, tree):
+        return VarTypeConsistencyCheck().evaluate_nodes(self.suite, deque(tree))
+
+    def test_robustness_and_var_type(self):
+        removed = 0
+        for pset in (self.pset_pre, self.pset_post):
+            for tree in self.random_trees(pset, 300):
+                original = copy.deepcopy(tree)
+                removed += simplification.simplify(tree, pset, self.suite)
+                self.assertLessEqual(len(tree), len(original))
+                for values, original_values in zip(self.robustness(tree), self.robustness(original)):
+                    np.testing.assert_array_equal(values, original_values, err_msg=f"{original} -> {tree}")
+                self.assertEqual(self.var_type(tree), self.var_type(original), f"{original} -> {tree}")
+        self.assertGreater(removed, 0)
+
+    def test_rewrites(self):
+        cases = {
+            "not(not(lt(yout, ic)))": "lt(yout, ic)",
+            "not(lt(yout, ic))": "ge(yout, ic)",
+            "or(and(lt(xin, yout), gt(yout, 1.0)), and(gt(yout, 1.0), lt(xin, yout)))":
+                "and(gt(yout, 1.0), lt(xin, yout))",
+            "lt(add(yout, 0.0), ic)": "lt(yout, ic)",
+            # degenerate expressions stay unit mismatches
+            "lt(sub(yout, yout), ic)": "lt(sub(yout, yout), ic)",
+            "lt(add(2.0, 3.0), ic)": "lt(add(2.0, 3.0), ic)",
+        }
+        for tree_str, simplified in cases.items():
+            tree = gp.PrimitiveTree.from_string(tree_str, self.pset_post)
+            simplification.simplify(tree, self.pset_post, self.suite)
+            self.assertEqual(str(tree), simplified)
+
+    def test_constant_units(self):
+        # Folded constants keep the (ephemeral) unit of their operands
+        ephemerals = [terminal for terminal in self.pset_post.terminals[float] if isinstance(terminal, type)]
+        for ephemeral in ephemerals:
+            for other in ephemerals:
+                tree = gp.PrimitiveTree([self.pset_post.mapping["lt"], self.pset_post.mapping["add"], ephemeral(),
+                                         other(), self.pset_post.mapping["yout"]])
+                original = copy.deepcopy(tree)
+                simplification.simplify(tree, self.pset_post, self.suite)
+                self.assertEqual(self.var_type(tree), self.var_type(original))
+                if ephemeral is not other:  # not folded
+                    self.assertEqual(len(tree), len(original))
+                for node in tree:
+                    if isinstance(node, gp.Terminal) and isinstance(node.value, float):
+                        self.assertIn(type(node), ephemerals)
+
+    def test_canonical_archive_key(self):
+        archive = FitnessArchive(canonical=True)
+        pre = gp.PrimitiveTree.from_string("eq(reset, 1.0)", self.pset_pre)
+        post1 = gp.PrimitiveTree.from_string("and(lt(yout, ic), gt(ic, 1.0))", self.pset_post)
+        post2 = gp.PrimitiveTree.from_string("and(gt(ic, 1.0), lt(yout, ic))", self.pset_post)
+        self.assertEqual(archive.key(pre, post1), archive.key(pre, post2))
+        self.assertNotEqual(FitnessArchive().key(pre, post1), FitnessArchive().key(pre, post2))
+        # Simplified genomes are their own canonical keys
+        simplification.simplify(pre, self.pset_pre, self.suite)
+        simplification.simplify(post1, self.pset_post, self.suite)
+        self.assertEqual(archive.key(pre, post1), (str(pre), str(post1)))
+
+
+if __name__ == "__main__":
+    unittest.main()
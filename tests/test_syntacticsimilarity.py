@@ -0,0 +1,88 @@
+import importlib.util
+import os
+import random
+import unittest
+from types import SimpleNamespace
+
+from deap import gp
+
+from repair.approach.optimization.expressiongenerator import generate_expr
+from repair.approach.trace import get_trace_suite
+from repair.fitness.desirability.syntacticsimilarity import (TreeEditDistance, preprocess_tree, tree_edit_distance,
+                                                             tree_edit_operations)
+from repair.grammar import grammar
+
+DATA_DIR = os.path.join(os.path.dirname(os.path.abspath(__file__)), os.pardir, "data")
+
+
+class TreeEditDistanceTest(unittest.TestCase):
+
+    @classmethod
+    def setUpClass(cls):
+        suite = get_trace_suite(os.path.join(DATA_DIR, "traces"), {"xin", "reset", "TL", "BL", "ic", "dT"}, 0.0)
+        _, cls.pset = grammar.get_gp_primitive_sets(suite, 1.2)
+        random.seed(0)
+        cls.trees = [gp.PrimitiveTree(generate_expr(cls.pset, 2, 4)) for _ in range(60)]
+
+    def test_upper_bound(self):
+        # At or above the exact distance, the exact distance; below it, a lower bound still above the upper bound
+        for tree1, tree2 in zip(self.trees[::2], self.trees[1::2]):
+            preprocessed1, preprocessed2 = preprocess_tree(tree1), preprocess_tree(tree2)
+            exact = tree_edit_distance(preprocessed1, preprocessed2)
+            for upper_bound in range(exact + 2):
+                distance = tree_edit_distance(preprocessed1, preprocessed2, upper_bound)
+                if upper_bound >= exact:
+                    self.assertEqual(distance, exact)
+                else:
+                    self.assertGreater(distance, upper_bound)
+                    self.assertLessEqual(distance, exact)
+
+    @unittest.skipUnless(importlib.util.find_spec("zss"), "zss is not installed")
+    def test_zss_operations(self):
+        # Same operation count as the zss edit script, which the fitness was first computed with
+        import zss
+
+        def zss_node(tree, i=0):
+            node = zss.Node(tree[i].name)
+            i += 1
+            for _ in range(tree[i - 1].arity):
+                child, i = zss_node(tree, i)
+                node.addkid(child)
+            return node, i
+
+        for tree1 in self.trees[:20]:
+            for tree2 in self.trees[20:40]:
+                _, operations = zss.simple_distance(zss_node(tree1)[0], zss_node(tree2)[0], return_operations=True)
+                self.assertEqual(tree_edit_operations(preprocess_tree(tree1), preprocess_tree(tree2)),
+                                 sum(1 for operation in operations if operation.type != zss.Operation.match))
+
+    def test_max_fitness(self):
+        # The operation count is not bounded: max_fitness does not change the fitness
+        ted = TreeEditDistance()
+        original = SimpleNamespace(merged=self.trees[0])
+        for tree in self.trees[1:]:
+            current = SimpleNamespace(merged=tree)
+            fitness = ted.evaluate(current, original)
+            for max_fitness in (0.0, 0.25, 0.5, 0.75, 1.0):
+                self.assertEqual(ted.evaluate(current, original, max_fitness=max_fitness), fitness)
+
+    def test_max_fitness_exact(self):
+        ted = TreeEditDistance(exact=True)
+        original = SimpleNamespace(merged=self.trees[0])
+        cut = 0
+        for tree in self.trees[1:]:
+            current = SimpleNamespace(merged=tree)
+            exact = ted.evaluate(current, original)
+            for max_fitness in (0.0, 0.25, 0.5, 0.75, 1.0):
+                fitness = ted.evaluate(current, original, max_fitness=max_fitness)
+                if exact <= max_fitness:
+                    self.assertEqual(fitness, exact)
+                else:
+                    self.assertGreater(fitness, max_fitness)
+                    self.assertLessEqual(fitness, exact)
+                    cut += fitness < exact
+        self.assertGreater(cut, 0)  # the cutoff path was taken
+
+
+if __name__ == "__main__":
+    unittest.main()